@@ -0,0 +1,101 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+
+from tutorial.numerical_analysis.tools import Context
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Counts model calls and token usage, including calls made inside tools."""
+
+    def __init__(self):
+        self.model_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs):
+        with self._lock:
+            self.model_calls += 1
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    self.input_tokens += usage.get("input_tokens", 0)
+                    self.output_tokens += usage.get("output_tokens", 0)
+
+
+def load_questions(path: str) -> List[str]:
+    """One question per line; blank lines and lines starting with ``#`` are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _ask(agent: Runnable, question: str, context: Context) -> Dict:
+    handler = UsageCallbackHandler()
+    start = time.perf_counter()
+
+    try:
+        result = agent.invoke({"messages": HumanMessage(content=question)}, context=context,
+                              config={"callbacks": [handler]})
+        answer, error = result["messages"][-1].content, None
+    except Exception as e:
+        answer, error = None, str(e)
+
+    return {
+        "question": question,
+        "answer": answer,
+        "error": error,
+        "latency": time.perf_counter() - start,
+        "model_calls": handler.model_calls,
+        "input_tokens": handler.input_tokens,
+        "output_tokens": handler.output_tokens,
+    }
+
+
+def run_batch(agent: Runnable, questions: List[str], context: Context, max_concurrency: int = 4) -> List[Dict]:
+    """Answer ``questions`` with ``agent``, at most ``max_concurrency`` at a time.
+
+    All questions share the agent's tool instances, so the schema, code,
+    result and DataFrame caches and the worker pool are shared too.
+
+    Returns:
+        One record per question, in input order, with the answer or error,
+        latency in seconds, model-call count and token usage.
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return list(executor.map(lambda question: _ask(agent, question, context), questions))
+
+
+def print_report(records: List[Dict], wall_time: float):
+    print(f"{'#':>3}  {'latency':>8}  {'calls':>5}  {'in tok':>8}  {'out tok':>8}  question")
+
+    for i, record in enumerate(records, start=1):
+        status = "" if record["error"] is None else f"  [ERROR: {record['error']}]"
+        print(f"{i:>3}  {record['latency']:>7.2f}s  {record['model_calls']:>5}  "
+              f"{record['input_tokens']:>8}  {record['output_tokens']:>8}  {record['question']}{status}")
+
+    latencies = sorted(record["latency"] for record in records)
+    if not latencies:
+        return
+
+    p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+    print(f"\n{len(records)} questions in {wall_time:.2f}s "
+          f"({len(records) / wall_time * 60:.1f} questions/min), "
+          f"latency p50 {statistics.median(latencies):.2f}s / p95 {p95:.2f}s, "
+          f"{sum(r['model_calls'] for r in records)} model calls, "
+          f"{sum(r['input_tokens'] for r in records)} input / "
+          f"{sum(r['output_tokens'] for r in records)} output tokens")
+
+
+def write_records(records: List[Dict], path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,215 @@
+"""Offline latency benchmarks for the numerical_analysis data path.
+
+Usage:
+    python -m tutorial.numerical_analysis.benchmark columnar --rows 1000000
+    python -m tutorial.numerical_analysis.benchmark tools --sizes 10000 100000 1000000 10000000 \
+        --output bench.json [--baseline previous.json --tolerance 0.25]
+
+The ``tools`` suite drives SchemaTool and PandasTool with ScriptedChatModel,
+so no model endpoint is needed and only the data path is measured.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from textwrap import dedent
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from tutorial.numerical_analysis import columnar
+
+CITIES = ["臺北市", "新北市", "桃園市", "臺中市", "臺南市", "高雄市", "基隆市", "新竹市", "嘉義市"]
+SCHOOL_TYPES = ["國小", "國中", "高中", "高職", "大專"]
+
+
+def make_synthetic_csv(path: str, rows: int, seed: int = 0) -> str:
+    """Write a student-count table shaped like the course's government datasets."""
+    rng = np.random.default_rng(seed)
+
+    df = pd.DataFrame({
+        "縣市": rng.choice(CITIES, rows),
+        "學年度": rng.integers(2015, 2025, rows),
+        "學校類別": rng.choice(SCHOOL_TYPES, rows),
+        "學校代碼": rng.integers(100000, 999999, rows).astype(str),
+        "男學生數": rng.integers(0, 2000, rows),
+        "女學生數": rng.integers(0, 2000, rows),
+        "外國學生數": rng.integers(0, 50, rows),
+        "師生比": rng.random(rows).round(3),
+    })
+    df.to_csv(path, index=False, encoding="utf-8")
+
+    return path
+
+
+def _timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+
+    return time.perf_counter() - start
+
+
+def benchmark_columnar(path: str, repeat: int = 5) -> dict:
+    """Compare plain CSV parsing with the cold (build) and warm (mmap) columnar shim.
+
+    Returns:
+        Seconds per read: median ``csv``, single ``cold`` build and median ``warm``.
+    """
+    shadow = columnar.shadow_path(path, encoding="utf-8")
+    if os.path.exists(shadow):
+        os.remove(shadow)
+
+    csv = [_timed(columnar._read_csv, path, encoding="utf-8") for _ in range(repeat)]
+    cold = _timed(columnar.read_csv, path)
+    warm = [_timed(columnar.read_csv, path) for _ in range(repeat)]
+
+    if os.path.exists(shadow):
+        os.remove(shadow)
+
+    return {"csv": statistics.median(csv), "cold": cold, "warm": statistics.median(warm)}
+
+
+BENCHMARK_PANDAS_CODE = dedent("""
+    df = load_csv({files}[0])
+    df = df[(df['縣市'] == '臺中市') & df['學年度'].between(2021, 2024)]
+    print(df.groupby('學年度')[['男學生數', '女學生數']].sum().to_string())
+""").strip()
+
+# Metrics compared against a baseline; all of them are "lower is better".
+TOOL_METRICS = ["schema_cold", "schema_warm", "pool_start", "pandas_cold", "pandas_warm", "rss_tool_mb", "rss_workers_mb"]
+
+
+def _peak_rss_mb(who) -> float:
+    if resource is None:
+        return float("nan")
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == "darwin" else 1024
+
+    return resource.getrusage(who).ru_maxrss / scale
+
+
+def _benchmark_tools(directory: str, file: str) -> dict:
+    """Time both tools on one file. Runs in a fresh process so peak RSS is per measurement."""
+    from tutorial.numerical_analysis.execution import get_pool, shutdown_pool
+    from tutorial.numerical_analysis.fake_model import ScriptedChatModel
+    from tutorial.numerical_analysis.tools import Context, PandasTool, SchemaTool
+
+    llm = ScriptedChatModel(pandas_code=BENCHMARK_PANDAS_CODE)
+    runtime = SimpleNamespace(context=Context(directory=directory))
+    schema_tool = SchemaTool.create(llm=llm, mode="native")
+    pandas_tool = PandasTool.create(llm=llm, chunk_threshold=None, timeout=None, memory_limit=None)
+
+    result = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result["schema_cold"] = _timed(schema_tool._run, runtime=runtime)
+        result["schema_warm"] = _timed(schema_tool._run, runtime=runtime)
+        # worker start-up (spawn + library imports) is reported apart from the first execution
+        result["pool_start"] = _timed(get_pool().execute, "pass")
+        result["pandas_cold"] = _timed(pandas_tool._run, runtime=runtime, files=[file], context="benchmark")
+        result["pandas_warm"] = _timed(pandas_tool._run, runtime=runtime, files=[file], context="benchmark")
+
+    # workers must exit before their peak RSS shows up in RUSAGE_CHILDREN
+    shutdown_pool()
+    result["rss_tool_mb"] = _peak_rss_mb(resource.RUSAGE_SELF) if resource else float("nan")
+    result["rss_workers_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else float("nan")
+
+    return result
+
+
+def benchmark_tools(sizes, seed: int = 0) -> dict:
+    """Run the SchemaTool/PandasTool suite on synthetic CSVs of each size in ``sizes`` (rows).
+
+    Returns:
+        ``{rows: {metric: value}}`` with times in seconds and peak RSS in MB.
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            make_synthetic_csv(os.path.join(directory, "synthetic.csv"), rows, seed)
+
+            # not multiprocessing.Pool: its daemonic workers cannot start the tools' worker pool
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[str(rows)] = executor.submit(_benchmark_tools, directory, "synthetic.csv").result()
+
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """List the metrics that got worse than ``baseline`` by more than ``tolerance`` (a fraction)."""
+    regressions = []
+
+    for rows, metrics in results.items():
+        for metric in TOOL_METRICS:
+            before, after = baseline.get(rows, {}).get(metric), metrics.get(metric)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{rows} rows {metric}: {before:.3f} -> {after:.3f} (+{after / before - 1:.0%})")
+
+    return regressions
+
+
+def _print_tools(results: dict):
+    print(f"{'rows':>10}  " + "  ".join(f"{metric:>14}" for metric in TOOL_METRICS))
+    for rows, metrics in results.items():
+        print(f"{int(rows):>10}  " + "  ".join(f"{metrics[metric]:>14.3f}" for metric in TOOL_METRICS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=["columnar", "tools"])
+    parser.add_argument("--file", help="CSV to benchmark; a synthetic one is generated when omitted")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows of the synthetic CSV")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000],
+                        help="synthetic CSV sizes (rows) for the tools suite")
+    parser.add_argument("--output", help="write the tools suite results as JSON")
+    parser.add_argument("--baseline", help="tools suite JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    if args.benchmark == "tools":
+        results = benchmark_tools(args.sizes)
+        _print_tools(results)
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            if regressions:
+                sys.exit(1)
+
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file or make_synthetic_csv(os.path.join(tmp, "synthetic.csv"), args.rows)
+        size = os.path.getsize(path) / 1024 ** 2
+
+        result = benchmark_columnar(path, args.repeat)
+        print(f"{path} ({size:.1f} MB)")
+        print(f"  pd.read_csv        : {result['csv'] * 1000:9.1f} ms")
+        print(f"  shim, cold (build) : {result['cold'] * 1000:9.1f} ms")
+        print(f"  shim, warm (mmap)  : {result['warm'] * 1000:9.1f} ms "
+              f"({result['csv'] / result['warm']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from src.path.path_definition import get_project_dir
+
+
+def get_cache_dir(name: str) -> str:
+    """Return (and create) a cache sub-directory under ``<project>/.cache/numerical_analysis``."""
+    directory = os.path.join(get_project_dir(), ".cache", "numerical_analysis", name)
+    os.makedirs(directory, exist_ok=True)
+
+    return directory
+
+
+def temp_path(path: str) -> str:
+    """Create an empty temporary file next to ``path``, unique per process and thread, to write then rename."""
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory or None)
+    os.close(fd)
+
+    return tmp
+
+
+def file_fingerprint(path: str) -> Tuple[str, int, int]:
+    """Identify a file's content by (absolute path, size, mtime in nanoseconds)."""
+    stat = os.stat(path)
+
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+def schema_fingerprint(path: str) -> str:
+    """Hash of the CSV header line, which stays stable when rows are appended or edited."""
+    with open(path, "rb") as f:
+        header = f.readline()
+
+    return hashlib.sha1(header.strip()).hexdigest()
+
+
+def hash_key(*parts: Any) -> str:
+    """Build a stable cache key from JSON-serialisable parts."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def file_key_prefix(fingerprint: Tuple[str, int, int]) -> str:
+    """Start of every ``file_key`` built for this version of the file."""
+    return f"{hash_key(fingerprint[0])[:12]}-{hash_key(fingerprint)[:12]}-"
+
+
+def file_key(fingerprint: Tuple[str, int, int], *parts: Any) -> str:
+    """Cache key for data derived from a single file.
+
+    The key starts with short hashes of the file's path and of its fingerprint,
+    so ``purge_file_entries`` can drop the entries of outdated versions of a
+    file without knowing the other parts.
+    """
+    return f"{file_key_prefix(fingerprint)}{hash_key(*parts)}"
+
+
+def purge_file_entries(directory: str, path: str, current: Optional[Tuple[str, int, int]] = None) -> int:
+    """Delete the entries built by ``file_key`` for ``path`` except those of the ``current`` fingerprint.
+
+    Returns:
+        The number of files removed.
+    """
+    prefix = f"{hash_key(os.path.abspath(path))[:12]}-"
+    keep = None if current is None else file_key_prefix(current)
+    removed = 0
+
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and not (keep and entry.name.startswith(keep)):
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    return removed
+
+
+class DiskCache:
+    """A directory of JSON files, one per key."""
+
+    def __init__(self, name: str):
+        self.directory = get_cache_dir(name)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set(self, key: str, value: Any):
+        # write-then-rename so concurrent readers never see a partial file
+        tmp = temp_path(self._path(key))
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+class LRUCache(DiskCache):
+    """A ``DiskCache`` bounded to ``max_entries`` with least-recently-used eviction.
+
+    Hot entries are also kept in memory. Recency survives restarts through
+    the files' mtimes, which are refreshed on every hit.
+
+    Args:
+        name: Cache sub-directory, see ``get_cache_dir``.
+        max_entries: Number of entries kept both in memory and on disk.
+    """
+
+    def __init__(self, name: str, max_entries: int = 256):
+        super().__init__(name)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                value = self._memory[key]
+            else:
+                value = super().get(key)
+                if value is None:
+                    return None
+                self._remember(key, value)
+
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            pass
+
+        return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._remember(key, value)
+            super().set(key, value)
+            self._evict()
+
+    def _remember(self, key: str, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,164 @@
+import io
+import os
+import uuid
+from collections import deque
+from typing import Optional
+
+from tutorial.numerical_analysis.cache import get_cache_dir
+
+# Output longer than this is truncated before it reaches the agent.
+DEFAULT_MAX_OUTPUT_CHARS = 8000
+# Spilled outputs kept on disk, oldest removed first.
+MAX_ARTIFACTS = 200
+
+
+def artifact_path(artifact_id: str) -> str:
+    return os.path.join(get_cache_dir("artifacts"), f"{os.path.basename(artifact_id)}.txt")
+
+
+def read_artifact(artifact_id: str, start_line: int = 0, max_lines: Optional[int] = None,
+                  max_chars: Optional[int] = None) -> str:
+    """Return (a line range of) the full output saved by a truncated capture.
+
+    With ``max_chars`` the range stops before the first line that would not
+    fit, keeping at least one line (cut to ``max_chars``).
+    """
+    lines = []
+    chars = 0
+
+    with open(artifact_path(artifact_id), "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i < start_line:
+                continue
+            if max_lines is not None and len(lines) >= max_lines:
+                break
+            if max_chars is not None and chars + len(line) > max_chars:
+                if not lines:
+                    lines.append(line[:max_chars])
+                break
+            lines.append(line)
+            chars += len(line)
+
+    return "".join(lines)
+
+
+def _prune_artifacts():
+    entries = [entry for entry in os.scandir(get_cache_dir("artifacts")) if entry.name.endswith(".txt")]
+    if len(entries) <= MAX_ARTIFACTS:
+        return
+
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+    for entry in entries[:len(entries) - MAX_ARTIFACTS]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class BoundedCapture(io.TextIOBase):
+    """A stdout replacement that holds at most ``max_chars`` characters in memory.
+
+    Until the limit is reached it behaves like ``io.StringIO``. Past it, the
+    full stream is written through to an on-disk artifact and only the first
+    and last ``max_chars / 2`` characters are kept; ``getvalue`` then returns
+    that head and tail, cut on line boundaries, with the number of omitted
+    lines and the artifact id in between.
+
+    Args:
+        max_chars: Size of the in-memory capture and of the returned output.
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_MAX_OUTPUT_CHARS):
+        super().__init__()
+        self.max_chars = max_chars
+        self.head_chars = max_chars // 2
+        self.tail_chars = max_chars - self.head_chars
+        self.chars = 0
+        self.lines = 0
+        self.artifact_id: Optional[str] = None
+
+        self._buffer = io.StringIO()
+        self._head = ""
+        self._tail = deque()
+        self._tail_len = 0
+        self._artifact = None
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        self.chars += len(s)
+        self.lines += s.count("\n")
+
+        if self._artifact is None:
+            self._buffer.write(s)
+            if self.chars > self.max_chars:
+                self._spill()
+            return len(s)
+
+        self._artifact.write(s)
+        self._push_tail(s)
+
+        return len(s)
+
+    def _spill(self):
+        text = self._buffer.getvalue()
+        self._buffer = None
+
+        self.artifact_id = uuid.uuid4().hex
+        _prune_artifacts()
+        self._artifact = open(artifact_path(self.artifact_id), "w", encoding="utf-8")
+        self._artifact.write(text)
+
+        self._head = text[:self.head_chars]
+        self._push_tail(text[self.head_chars:])
+
+    def _push_tail(self, s: str):
+        self._tail.append(s)
+        self._tail_len += len(s)
+
+        while self._tail_len - len(self._tail[0]) >= self.tail_chars:
+            self._tail_len -= len(self._tail.popleft())
+
+    @property
+    def truncated(self) -> bool:
+        return self._artifact is not None
+
+    def getvalue(self) -> str:
+        if self._artifact is None:
+            return self._buffer.getvalue()
+
+        self._artifact.flush()
+
+        head = self._head
+        if "\n" in head:
+            head = head[:head.rfind("\n") + 1]
+
+        tail = "".join(self._tail)[-self.tail_chars:]
+        if "\n" in tail[:-1]:
+            tail = tail[tail.find("\n") + 1:]
+
+        omitted = self.lines - head.count("\n") - tail.count("\n")
+
+        return (f"{head}"
+                f"... [output truncated: {omitted} of {self.lines} lines ({self.chars} characters) omitted; "
+                f"full output saved as artifact {self.artifact_id}] ...\n"
+                f"{tail}")
+
+    def close(self):
+        if self._artifact is not None:
+            self._artifact.close()
+        super().close()
+
+
+def bound_text(text: str, max_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS) -> str:
+    """Apply ``BoundedCapture`` truncation (and spill-over) to an already built string."""
+    if max_chars is None or len(text) <= max_chars:
+        return text
+
+    capture = BoundedCapture(max_chars)
+    capture.write(text)
+    output = capture.getvalue()
+    capture.close()
+
+    return output
@@ -0,0 +1,141 @@
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+# Partial statistics kept per group, and how partials from different chunks combine.
+_PARTIALS = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+SUPPORTED_AGGREGATIONS = {"sum", "count", "mean", "min", "max"}
+
+DEFAULT_CHUNKSIZE = 500_000
+
+
+def iter_csv_chunks(path: str, chunksize: int = DEFAULT_CHUNKSIZE, **kwargs) -> Iterator[pd.DataFrame]:
+    """Yield ``path`` as DataFrames of at most ``chunksize`` rows."""
+    kwargs.setdefault("encoding", "utf-8")
+
+    with pd.read_csv(path, chunksize=chunksize, **kwargs) as reader:
+        yield from reader
+
+
+def _combine(partials: List[pd.DataFrame], by: List[str]) -> pd.DataFrame:
+    combined = pd.concat(partials)
+    how = {column: _PARTIALS[column[1]] for column in combined.columns}
+
+    if by:
+        return combined.groupby(level=list(range(len(by))), dropna=False).agg(how)
+
+    return combined.agg(how).to_frame().T
+
+
+def _needed_partials(funcs: List[str]) -> List[str]:
+    """Partial statistics needed to derive ``funcs``: ``mean`` needs sum and count, the others themselves."""
+    needed = {partial for func in funcs for partial in (("sum", "count") if func == "mean" else (func,))}
+
+    return [partial for partial in _PARTIALS if partial in needed]
+
+
+def _prepare(by: Union[str, List[str], None],
+             agg: Dict[str, Union[str, List[str]]]) -> Tuple[List[str], Dict[str, List[str]]]:
+    by = [by] if isinstance(by, str) else list(by or [])
+    agg = {column: [funcs] if isinstance(funcs, str) else list(funcs) for column, funcs in agg.items()}
+
+    unsupported = {f for funcs in agg.values() for f in funcs} - SUPPORTED_AGGREGATIONS
+    if unsupported:
+        raise ValueError(f"Unsupported aggregations: {sorted(unsupported)}")
+
+    return by, agg
+
+
+def partial_groupby(path: str,
+                    by: List[str],
+                    agg: Dict[str, List[str]],
+                    query: Optional[str] = None,
+                    chunksize: int = DEFAULT_CHUNKSIZE,
+                    combine_every: int = 16,
+                    **kwargs) -> Optional[pd.DataFrame]:
+    """Per-group partial statistics of ``path``, to be merged with ``combine_partials``.
+
+    Only the statistics ``agg`` needs are computed, so e.g. a ``count`` of a
+    text column never sums (concatenates) its strings.
+
+    Returns:
+        The partial statistics, or ``None`` when no row passes ``query``.
+    """
+    # usecols keeps the parser from materialising columns nobody asked for,
+    # unless a query may reference others
+    if query is None:
+        kwargs.setdefault("usecols", list(dict.fromkeys(by + list(agg))))
+
+    stats = {column: _needed_partials(funcs) for column, funcs in agg.items()}
+    partials = []
+
+    for chunk in iter_csv_chunks(path, chunksize=chunksize, **kwargs):
+        if query is not None:
+            chunk = chunk.query(query)
+        if chunk.empty:
+            continue
+
+        if by:
+            partials.append(chunk.groupby(by, dropna=False, observed=True).agg(stats))
+        else:
+            partials.append(pd.DataFrame({(column, stat): [chunk[column].agg(stat)]
+                                          for column, funcs in stats.items() for stat in funcs}))
+
+        if len(partials) >= combine_every:
+            partials = [_combine(partials, by)]
+
+    return _combine(partials, by) if partials else None
+
+
+def combine_partials(partials: List[Optional[pd.DataFrame]], by: List[str],
+                     agg: Dict[str, List[str]]) -> pd.DataFrame:
+    """Merge ``partial_groupby`` results and derive the requested aggregations."""
+    partials = [partial for partial in partials if partial is not None]
+
+    if not partials:
+        columns = pd.MultiIndex.from_tuples([(c, f) for c, funcs in agg.items() for f in funcs])
+        return pd.DataFrame(columns=columns)
+
+    total = _combine(partials, by)
+
+    result = pd.DataFrame(index=total.index)
+    for column, funcs in agg.items():
+        for func in funcs:
+            if func == "mean":
+                result[(column, func)] = total[(column, "sum")] / total[(column, "count")]
+            else:
+                result[(column, func)] = total[(column, func)]
+    result.columns = pd.MultiIndex.from_tuples(result.columns)
+
+    return result.sort_index() if by else result.reset_index(drop=True)
+
+
+def chunked_groupby(path: str,
+                    by: Union[str, List[str], None],
+                    agg: Dict[str, Union[str, List[str]]],
+                    query: Optional[str] = None,
+                    chunksize: int = DEFAULT_CHUNKSIZE,
+                    combine_every: int = 16,
+                    **kwargs) -> pd.DataFrame:
+    """Group and aggregate a CSV that does not fit in memory.
+
+    Each chunk is reduced to the per-group sum/count/min/max the aggregations
+    need, partials are merged every ``combine_every`` chunks, and ``mean`` is
+    derived from sum and count at the end, so memory is bounded by the chunk
+    size plus the number of groups.
+
+    Args:
+        path: Full path of the CSV file.
+        by: Column(s) to group by; ``None`` aggregates the whole file.
+        agg: Column -> aggregation(s), from ``sum``, ``count``, ``mean``, ``min``, ``max``.
+        query: Optional ``DataFrame.query`` filter applied to every chunk first.
+        chunksize: Rows parsed per chunk.
+        combine_every: Number of chunk partials buffered before merging.
+        **kwargs: Passed to ``pd.read_csv``.
+
+    Returns:
+        One row per group with ``(column, aggregation)`` columns, like ``groupby().agg()``.
+    """
+    by, agg = _prepare(by, agg)
+
+    return combine_partials([partial_groupby(path, by, agg, query, chunksize, combine_every, **kwargs)], by, agg)
@@ -0,0 +1,73 @@
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # the columnar cache is optional
+    pa = None
+    feather = None
+
+from tutorial.numerical_analysis.cache import file_fingerprint, file_key, get_cache_dir, temp_path
+
+# The real parser, captured before ``install_read_csv_shim`` can replace it.
+_read_csv = pd.read_csv
+
+# Options that make read_csv return something other than a single DataFrame.
+_STREAMING_OPTIONS = {"chunksize", "iterator", "nrows", "skiprows", "skipfooter"}
+
+
+def shadow_path(path: str, **kwargs) -> str:
+    """Location of the Arrow/Feather copy of ``path`` parsed with ``kwargs``.
+
+    The name embeds the file fingerprint, so an edited source file maps to a
+    new shadow and stale copies are never read again (``purge_file_entries``
+    removes them).
+    """
+    key = file_key(file_fingerprint(path), "columnar", kwargs)
+
+    return os.path.join(get_cache_dir("columnar"), f"{key}.feather")
+
+
+def read_csv(filepath_or_buffer, *args, **kwargs):
+    """``pd.read_csv`` replacement backed by a memory-mapped columnar shadow copy.
+
+    The first read of a file parses the CSV and writes an uncompressed Feather
+    file next to the other caches; later reads of the unchanged file memory-map
+    that copy instead of parsing text. Anything the shadow cannot represent
+    (buffers, positional arguments, chunked reads, missing pyarrow) falls back
+    to the real ``pd.read_csv``.
+    """
+    if (feather is None or args or not isinstance(filepath_or_buffer, (str, os.PathLike))
+            or _STREAMING_OPTIONS & kwargs.keys() or not os.path.isfile(filepath_or_buffer)):
+        return _read_csv(filepath_or_buffer, *args, **kwargs)
+
+    path = os.fspath(filepath_or_buffer)
+    kwargs.setdefault("encoding", "utf-8")
+    shadow = shadow_path(path, **kwargs)
+
+    if os.path.exists(shadow):
+        return feather.read_table(shadow, memory_map=True).to_pandas()
+
+    df = _read_csv(path, **kwargs)
+
+    tmp = temp_path(shadow)
+    try:
+        feather.write_feather(pa.Table.from_pandas(df), tmp, compression="uncompressed")
+        os.replace(tmp, shadow)
+    except (pa.ArrowException, OSError, TypeError, ValueError):
+        # e.g. object columns mixing types; keep serving from the CSV
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    return df
+
+
+def install_read_csv_shim():
+    """Route ``pd.read_csv`` through ``read_csv`` in this process."""
+    pd.read_csv = read_csv
+
+
+def uninstall_read_csv_shim():
+    pd.read_csv = _read_csv
@@ -0,0 +1,223 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: only threads of one process are serialized
+    fcntl = None
+
+from tutorial.numerical_analysis.cache import (DiskCache, file_fingerprint, file_key, file_key_prefix, get_cache_dir,
+                                               purge_file_entries, temp_path)
+from tutorial.numerical_analysis.chunked import _PARTIALS, _prepare, combine_partials, partial_groupby
+
+# Bump when the cube layout changes so stale cubes are ignored.
+CUBE_VERSION = 1
+# Cubes above this many groups are not worth keeping: they are barely smaller than the data.
+MAX_CUBE_ROWS = 1_000_000
+# Cubes each worker keeps in memory between executions.
+CUBE_CACHE_SIZE = 32
+
+_cubes: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+_usage_cache = None
+_usage_lock = threading.Lock()
+# (file fingerprint, dimensions) -> cube, or None when the file cannot have one, for every
+# pair materialize already handled, so it is only checked again once the file changes
+_materialized: Dict[Tuple, Optional[str]] = {}
+_materialized_lock = threading.Lock()
+
+
+def _get_usage_cache() -> DiskCache:
+    global _usage_cache
+
+    if _usage_cache is None:
+        _usage_cache = DiskCache("cube_usage")
+
+    return _usage_cache
+
+
+def cube_path(path: str, dimensions: List[str]) -> str:
+    key = file_key(file_fingerprint(path), "cube", CUBE_VERSION, sorted(dimensions))
+
+    return os.path.join(get_cache_dir("cubes"), f"{key}.pkl")
+
+
+def build_cube(path: str, dimensions: List[str]) -> Optional[str]:
+    """Pre-aggregate ``path`` over ``dimensions`` and persist the result.
+
+    The cube holds, per combination of dimension values, the sum, count, min
+    and max of every other numeric column, which is enough to answer any
+    ``sum``/``count``/``mean``/``min``/``max`` group-by over a subset of the
+    dimensions. The file is streamed in chunks, as in ``chunked_groupby``.
+
+    Returns:
+        Where the cube is stored, or ``None`` when the file lacks one of the
+        dimensions or the cube would be too large to help.
+    """
+    target = cube_path(path, dimensions)
+    if os.path.exists(target):
+        return target
+
+    sample = pd.read_csv(path, encoding="utf-8", nrows=1000)
+    if not set(dimensions) <= set(sample.columns):
+        return None
+
+    measures = [str(column) for column in sample.columns
+                if column not in dimensions and pd.api.types.is_numeric_dtype(sample[column])
+                and not pd.api.types.is_bool_dtype(sample[column])]
+    if not measures:
+        return None
+
+    cube = partial_groupby(path, list(dimensions), {measure: list(_PARTIALS) for measure in measures})
+    if cube is None or len(cube) > MAX_CUBE_ROWS:
+        return None
+
+    tmp = temp_path(target)
+    cube.to_pickle(tmp)
+    os.replace(tmp, target)
+
+    return target
+
+
+def materialize(paths: List[str], dimensions: List[List[str]], max_workers: Optional[int] = None) -> List[str]:
+    """Build the missing cubes of ``paths`` for every dimension set, dropping those of older file versions.
+
+    Each (file version, dimension set) is handled once per process, so calls
+    after the first only do work when a file changed or a new dimension set
+    became frequent enough (see ``observed_dimensions``).
+
+    Returns:
+        The paths of the cubes now available.
+    """
+    keys = {(path, tuple(dims)): (file_fingerprint(path), tuple(sorted(dims))) for path in paths for dims in dimensions}
+    with _materialized_lock:
+        jobs = [job for job, key in keys.items() if key not in _materialized]
+
+    if jobs:
+        cube_dir = get_cache_dir("cubes")
+        for path in dict.fromkeys(path for path, _ in jobs):
+            purge_file_entries(cube_dir, path, file_fingerprint(path))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            built = list(executor.map(lambda job: build_cube(job[0], list(job[1])), jobs))
+
+        with _materialized_lock:
+            _materialized.update((keys[job], cube) for job, cube in zip(jobs, built))
+
+    with _materialized_lock:
+        return [cube for cube in dict.fromkeys(_materialized[key] for key in keys.values()) if cube is not None]
+
+
+def record_usage(dimensions: List[str]):
+    """Count a group-by over ``dimensions``, see ``observed_dimensions``."""
+    cache = _get_usage_cache()
+    key = "\t".join(sorted(dimensions))
+
+    # workers record concurrently: lock the read-modify-write across threads and processes
+    with _usage_lock, open(os.path.join(cache.directory, "usage.lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        usage = cache.get("usage") or {}
+        usage[key] = usage.get(key, 0) + 1
+        cache.set("usage", usage)
+
+
+def observed_dimensions(min_count: int = 3, top_k: int = 3) -> List[List[str]]:
+    """The ``top_k`` dimension sets grouped by at least ``min_count`` times without a cube."""
+    usage = _get_usage_cache().get("usage") or {}
+    frequent = sorted(((count, key) for key, count in usage.items() if count >= min_count and key), reverse=True)
+
+    return [key.split("\t") for _, key in frequent[:top_k]]
+
+
+def _load(cube_file: str) -> pd.DataFrame:
+    if cube_file in _cubes:
+        _cubes.move_to_end(cube_file)
+    else:
+        _cubes[cube_file] = pd.read_pickle(cube_file)
+        while len(_cubes) > CUBE_CACHE_SIZE:
+            _cubes.popitem(last=False)
+
+    return _cubes[cube_file]
+
+
+def _find_cube(path: str, by: List[str], measures: List[str], query: Optional[str]) -> Optional[pd.DataFrame]:
+    """Smallest cube of ``path`` covering ``by`` and ``measures``, with ``query`` applied to its dimensions."""
+    prefix = file_key_prefix(file_fingerprint(path))
+    candidates = [entry.path for entry in os.scandir(get_cache_dir("cubes"))
+                  if entry.name.startswith(prefix) and entry.name.endswith(".pkl")]
+
+    best = None
+    for candidate in candidates:
+        cube = _load(candidate)
+        if not set(by) <= set(cube.index.names) or not set(measures) <= set(cube.columns.get_level_values(0)):
+            continue
+
+        if query is not None:
+            try:
+                mask = cube.index.to_frame(index=False).eval(query).to_numpy(dtype=bool)
+            except Exception:
+                # the filter needs row-level columns the cube does not keep
+                continue
+            cube = cube[mask]
+
+        if best is None or len(cube) < len(best):
+            best = cube
+
+    return best
+
+
+def _rollup(cube: pd.DataFrame, by: List[str], measures: List[str]) -> Optional[pd.DataFrame]:
+    """Re-aggregate a cube's partial statistics to ``by``, like ``partial_groupby`` would on the file."""
+    if cube.empty:
+        return None
+
+    stats = cube[[(measure, stat) for measure in measures for stat in _PARTIALS]]
+    how = {column: _PARTIALS[column[1]] for column in stats.columns}
+
+    if by:
+        return stats.groupby(level=by, dropna=False).agg(how)
+
+    return stats.agg(how).to_frame().T
+
+
+def cube_groupby(paths: Union[str, List[str]],
+                 by: Union[str, List[str], None],
+                 agg: Dict[str, Union[str, List[str]]],
+                 query: Optional[str] = None,
+                 **kwargs) -> pd.DataFrame:
+    """``chunked_groupby`` over one or more files, answered from pre-aggregated cubes when possible.
+
+    A file is read from a cube when one covers every ``by`` column and
+    measure and ``query`` only filters on the cube's dimensions; other files
+    are scanned, and their group-by is counted towards ``observed_dimensions``.
+
+    Args:
+        paths: Full path(s) of the CSV files, e.g. one file per year.
+        by: Column(s) to group by; ``None`` aggregates everything.
+        agg: Column -> aggregation(s), from ``sum``, ``count``, ``mean``, ``min``, ``max``.
+        query: Optional ``DataFrame.query`` filter.
+        **kwargs: Passed to ``pd.read_csv``; read options other than the defaults
+            bypass the cubes, which were built without them.
+
+    Returns:
+        One row per group with ``(column, aggregation)`` columns, like ``groupby().agg()``.
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    by, agg = _prepare(by, agg)
+
+    partials = []
+    for path in paths:
+        cube = _find_cube(path, by, list(agg), query) if not kwargs else None
+        if cube is None:
+            record_usage(by)
+            partials.append(partial_groupby(path, by, agg, query, **kwargs))
+        else:
+            partials.append(_rollup(cube, by, list(agg)))
+
+    return combine_partials(partials, by, agg)
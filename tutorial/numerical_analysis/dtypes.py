@@ -0,0 +1,86 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Strings with at most this share of distinct values become categoricals.
+MAX_CATEGORY_RATIO = 0.5
+# Width integers are narrowed to with ``downcast_ints``; generated code multiplies and
+# sums columns, and narrower types would overflow silently even more often.
+MIN_INT_BITS = 32
+# Before pandas 3, groupby on a categorical also lists unobserved categories unless
+# code passes observed=True, so categoricals would change the shape of results.
+CATEGORIES_OBSERVED_BY_DEFAULT = int(pd.__version__.split(".")[0]) >= 3
+
+
+def _compact_column(series: pd.Series, max_category_ratio: float, downcast_floats: bool,
+                    downcast_ints: bool, categorize: bool) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series):
+        return series
+
+    if pd.api.types.is_integer_dtype(series):
+        if not downcast_ints or series.dtype.itemsize * 8 <= MIN_INT_BITS:
+            return series
+        info = np.iinfo(f"int{MIN_INT_BITS}")
+        if len(series) == 0 or (series.min() >= info.min and series.max() <= info.max):
+            return series.astype(f"int{MIN_INT_BITS}")
+        return series
+
+    if downcast_floats and pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+        narrow = series.astype(np.float32)
+        # only when every value survives the round trip
+        if ((narrow.astype(series.dtype) == series) | series.isna()).all():
+            return narrow
+        return series
+
+    if categorize and (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        if len(series) and series.nunique(dropna=True) <= max_category_ratio * len(series):
+            return series.astype("category")
+
+    return series
+
+
+def compact_frame(df: pd.DataFrame, max_category_ratio: float = MAX_CATEGORY_RATIO,
+                  downcast_floats: bool = False, downcast_ints: bool = False,
+                  categorize: bool = CATEGORIES_OBSERVED_BY_DEFAULT) -> Tuple[pd.DataFrame, Dict]:
+    """Shrink a DataFrame's memory footprint without changing its values.
+
+    Low-cardinality string columns become ``category``, by default only on
+    pandas 3 and later, where grouping by them gives the same result as
+    grouping by the strings. Numbers keep their width unless asked: with
+    ``downcast_ints`` 64-bit integers that fit become ``int32``, which
+    products and sums in generated code can overflow silently, and with
+    ``downcast_floats`` floats that convert exactly become ``float32``, which
+    aggregations accumulate in lower precision.
+
+    Args:
+        df: Frame to convert; it is not modified.
+        max_category_ratio: Largest distinct-values-to-rows ratio converted to ``category``.
+        downcast_floats: Also narrow exactly representable float columns.
+        downcast_ints: Also narrow 64-bit integer columns whose values fit in ``int32``.
+        categorize: Convert low-cardinality string columns to ``category``.
+
+    Returns:
+        The converted frame and ``{"before", "after", "columns"}``: deep memory
+        usage in bytes and the converted columns with their new dtypes.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+
+    compact = df.copy(deep=False)
+    converted = {}
+    for i, name in enumerate(df.columns):
+        column = _compact_column(df.iloc[:, i], max_category_ratio, downcast_floats, downcast_ints, categorize)
+        if column.dtype != df.dtypes.iloc[i]:
+            compact.isetitem(i, column)
+            converted[str(name)] = str(column.dtype)
+
+    return compact, {"before": before, "after": int(compact.memory_usage(deep=True).sum()), "columns": converted}
+
+
+def format_report(file: str, report: Dict) -> str:
+    saved = report["before"] - report["after"]
+    share = saved / report["before"] if report["before"] else 0.0
+
+    return (f"{file}: {report['before'] / 1024 ** 2:.1f} MB -> {report['after'] / 1024 ** 2:.1f} MB "
+            f"({share:.0%} saved, {len(report['columns'])} columns converted"
+            f"{', shared' if report.get('shared') else ''})")
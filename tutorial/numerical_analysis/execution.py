@@ -0,0 +1,418 @@
+import atexit
+import io
+import multiprocessing
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from tutorial.numerical_analysis.cache import file_fingerprint, hash_key
+from tutorial.numerical_analysis.capture import DEFAULT_MAX_OUTPUT_CHARS, BoundedCapture
+
+
+# Number of parsed DataFrames each worker keeps around between executions, and their total size.
+FRAME_CACHE_SIZE = 16
+FRAME_CACHE_BYTES = 2 * 1024 ** 3
+
+# key -> (file fingerprint, DataFrame, memory report)
+_frames: "OrderedDict[str, tuple]" = OrderedDict()
+# whether load_csv compacts dtypes and attaches to shared tables, set per execution
+# (see PandasTool.compact_dtypes and PandasTool.shared_frames)
+_compact_dtypes = False
+_shared_frames = False
+
+_pool: Optional["WorkerPool"] = None
+_pool_lock = threading.Lock()
+
+
+def load_csv(path: str, **kwargs):
+    """Drop-in for ``pd.read_csv(path, **kwargs)`` that reuses frames parsed by earlier executions.
+
+    Frames are keyed by the file fingerprint and the read options, so an edited
+    file is always re-parsed and the frames of its older versions are dropped
+    right away. When the execution asks for compact dtypes, frames go through
+    ``compact_frame`` once, before they are cached. With shared frames, the
+    table is memory-mapped from the copy published for all workers (see
+    ``tutorial.numerical_analysis.shared``) instead of being parsed here.
+    A shallow copy is returned, and pandas' copy-on-write copies a column
+    only when a script modifies it, so scripts cannot corrupt the cache and
+    cached frames are never duplicated up front.
+    """
+    import pandas as pd
+
+    if int(pd.__version__.split(".")[0]) < 3:
+        # the default from pandas 3 on; without it a script could write into a cached frame
+        pd.set_option("mode.copy_on_write", True)
+
+    kwargs.setdefault("encoding", "utf-8")
+    fingerprint = file_fingerprint(path)
+    key = hash_key(fingerprint, kwargs, _compact_dtypes, _shared_frames)
+
+    if key in _frames:
+        _frames.move_to_end(key)
+    else:
+        stale = [k for k, (cached, *_) in _frames.items() if cached[0] == fingerprint[0] and cached != fingerprint]
+        for k in stale:
+            del _frames[k]
+
+        if _shared_frames:
+            from tutorial.numerical_analysis.shared import attach
+
+            df, report = attach(path, _compact_dtypes, **kwargs)
+        elif _compact_dtypes:
+            from tutorial.numerical_analysis.dtypes import compact_frame
+
+            df, report = compact_frame(pd.read_csv(path, **kwargs))
+        else:
+            df = pd.read_csv(path, **kwargs)
+            size = int(df.memory_usage(deep=True).sum())
+            report = {"before": size, "after": size, "columns": {}}
+
+        _frames[key] = (fingerprint, df, report)
+        while len(_frames) > 1 and (len(_frames) > FRAME_CACHE_SIZE or
+                                    _private_bytes() > FRAME_CACHE_BYTES):
+            _frames.popitem(last=False)
+
+    return _frames[key][1].copy(deep=False)
+
+
+def _private_bytes() -> int:
+    # shared frames live in the page cache, not in this process
+    return sum(report["after"] for _, _, report in _frames.values() if not report.get("shared"))
+
+
+def frame_cache_report() -> str:
+    """Memory used by each DataFrame cached by ``load_csv`` in this process, and what compaction saved."""
+    from tutorial.numerical_analysis.dtypes import format_report
+
+    lines = [format_report(fingerprint[0], report) for fingerprint, _, report in _frames.values()]
+    lines.append(f"{len(_frames)} frames, {_private_bytes() / 1024 ** 2:.1f} MB private "
+                 f"of {FRAME_CACHE_BYTES / 1024 ** 2:.0f} MB")
+
+    return "\n".join(lines)
+
+
+def execute_code(code: str, namespace: Optional[dict] = None,
+                 max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS) -> str:
+    """Execute generated Python code and return everything it printed.
+
+    Args:
+        code: Plain Python source produced by the code-generation pipeline.
+        namespace: Extra globals made available to the code.
+        max_output_chars: Bound on the captured output, see ``BoundedCapture``;
+            ``None`` captures everything.
+
+    Returns:
+        The captured stdout, or an ``EXECUTION ERROR`` message if the code raised.
+    """
+    stdout_capture = io.StringIO() if max_output_chars is None else BoundedCapture(max_output_chars)
+    try:
+        with redirect_stdout(stdout_capture):
+            exec(code, {"__builtins__": __builtins__, **(namespace or {})})
+        output = stdout_capture.getvalue()
+    except MemoryError:
+        output = "EXECUTION ERROR: memory limit exceeded"
+    except Exception as e:
+        output = f"EXECUTION ERROR: {str(e)}"
+    finally:
+        stdout_capture.close()
+
+    return output
+
+
+def _namespace() -> dict:
+    """Helpers made available to every script run by a worker."""
+    from tutorial.numerical_analysis.chunked import chunked_groupby, iter_csv_chunks
+    from tutorial.numerical_analysis.cubes import cube_groupby
+    from tutorial.numerical_analysis.sharded import sharded_groupby
+
+    return {"load_csv": load_csv, "frame_cache_report": frame_cache_report,
+            "chunked_groupby": chunked_groupby, "iter_csv_chunks": iter_csv_chunks,
+            "sharded_groupby": sharded_groupby, "cube_groupby": cube_groupby}
+
+
+def _address_space() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _execute_with_limits(code: str, memory_limit: Optional[int], max_output_chars: Optional[int]) -> str:
+    """Run ``execute_code`` allowing the process to grow by at most ``memory_limit`` bytes."""
+    current = _address_space() if memory_limit and resource is not None else None
+
+    if current is None:
+        return execute_code(code, _namespace(), max_output_chars)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + memory_limit
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        return execute_code(code, _namespace(), max_output_chars)
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _execute_in_worker(code: str, memory_limit: Optional[int], columnar: bool,
+                       max_output_chars: Optional[int], compact_dtypes: bool = False,
+                       shared_frames: bool = False) -> str:
+    global _compact_dtypes, _shared_frames
+
+    _compact_dtypes, _shared_frames = compact_dtypes, shared_frames
+    if not columnar:
+        return _execute_with_limits(code, memory_limit, max_output_chars)
+
+    from tutorial.numerical_analysis.columnar import install_read_csv_shim, uninstall_read_csv_shim
+
+    # generated code imports pandas itself, so the shim has to live on the module
+    install_read_csv_shim()
+    try:
+        return _execute_with_limits(code, memory_limit, max_output_chars)
+    finally:
+        uninstall_read_csv_shim()
+
+
+def _warm_up():
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+
+    for module in ("scipy.stats", "sklearn"):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+
+def _worker_main(conn):
+    _warm_up()
+    conn.send("ready")
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+
+        if message is None:
+            break
+
+        conn.send(_execute_in_worker(*message))
+
+
+class _Worker:
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        # not a daemon, so scripts can fan out to processes of their own (see sharded_groupby);
+        # the worker exits when the pipe closes, and the pool stops it at exit
+        self.process = context.Process(target=_worker_main, args=(child_conn,))
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self):
+        # imports happen before the first script, and must not count against its timeout
+        if not self.ready:
+            self.conn.recv()
+            self.ready = True
+
+    def stop(self, force: bool = False):
+        if not force:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout=1)
+
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.conn.close()
+
+
+class WorkerPool:
+    """Long-lived worker processes with pandas, numpy, scipy and sklearn already imported.
+
+    Each worker keeps a cache of parsed DataFrames (see ``load_csv``) across
+    executions. A worker that runs past its wall-clock limit or dies is killed
+    and replaced, so one runaway script cannot block the agent.
+
+    Args:
+        size: Number of worker processes.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or min(4, os.cpu_count() or 1)
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+        for _ in range(self.size):
+            self._add_worker()
+
+    def _add_worker(self) -> _Worker:
+        worker = _Worker(self._context)
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+        return worker
+
+    def _replace(self, worker: _Worker):
+        with self._lock:
+            self._workers.remove(worker)
+        worker.stop(force=True)
+        self._add_worker()
+
+    def execute(self, code: str, timeout: Optional[float] = None, memory_limit: Optional[int] = None,
+                columnar: bool = False, max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS,
+                compact_dtypes: bool = False, shared_frames: bool = False) -> str:
+        """Run ``code`` on an idle worker.
+
+        Args:
+            code: Script to execute.
+            timeout: Wall-clock limit in seconds; ``None`` waits forever.
+            memory_limit: Bytes the worker may grow by while running the script
+                (enforced through ``RLIMIT_AS`` where available).
+            columnar: Serve ``pd.read_csv`` from columnar shadow copies
+                (see ``tutorial.numerical_analysis.columnar``).
+            max_output_chars: Bound on the returned output; longer output is
+                truncated and spilled to an artifact (see ``BoundedCapture``).
+            compact_dtypes: Have ``load_csv`` cache frames with compact dtypes
+                (see ``tutorial.numerical_analysis.dtypes``).
+            shared_frames: Have ``load_csv`` memory-map tables published once
+                for all workers (see ``tutorial.numerical_analysis.shared``).
+
+        Returns:
+            The script's stdout or an ``EXECUTION ERROR`` message.
+        """
+        worker = self._idle.get()
+
+        try:
+            worker.wait_ready()
+            worker.conn.send((code, memory_limit, columnar, max_output_chars, compact_dtypes, shared_frames))
+            if worker.conn.poll(timeout):
+                output = worker.conn.recv()
+            else:
+                output = f"EXECUTION ERROR: timed out after {timeout} seconds"
+                self._replace(worker)
+                return output
+        except (EOFError, BrokenPipeError, OSError):
+            output = "EXECUTION ERROR: worker process died"
+            self._replace(worker)
+            return output
+
+        self._idle.put(worker)
+
+        return output
+
+    def broadcast(self, code: str, timeout: Optional[float] = None, memory_limit: Optional[int] = None,
+                  columnar: bool = False, max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS,
+                  compact_dtypes: bool = False, shared_frames: bool = False) -> List[str]:
+        """Run ``code`` once on every worker, e.g. to fill their DataFrame caches.
+
+        Workers are claimed as they become idle and only released once all of
+        them have run the script, so none of them runs it twice.
+        """
+        workers = [self._idle.get() for _ in range(self.size)]
+        outputs, failed = [], []
+
+        for worker in workers:
+            try:
+                worker.wait_ready()
+                worker.conn.send((code, memory_limit, columnar, max_output_chars, compact_dtypes, shared_frames))
+            except (EOFError, BrokenPipeError, OSError):
+                failed.append(worker)
+
+        for worker in workers:
+            if worker in failed:
+                outputs.append("EXECUTION ERROR: worker process died")
+                continue
+
+            try:
+                if worker.conn.poll(timeout):
+                    outputs.append(worker.conn.recv())
+                    continue
+                outputs.append(f"EXECUTION ERROR: timed out after {timeout} seconds")
+            except (EOFError, BrokenPipeError, OSError):
+                outputs.append("EXECUTION ERROR: worker process died")
+            failed.append(worker)
+
+        for worker in workers:
+            if worker in failed:
+                self._replace(worker)
+            else:
+                self._idle.put(worker)
+
+        return outputs
+
+    def map(self, codes: List[str], timeout: Optional[float] = None, memory_limit: Optional[int] = None,
+            columnar: bool = False, max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS) -> List[str]:
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(lambda code: self.execute(code, timeout, memory_limit, columnar, max_output_chars),
+                                     codes))
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+
+        for worker in workers:
+            worker.stop()
+
+
+def get_pool(size: Optional[int] = None) -> WorkerPool:
+    """Return the worker pool shared by all tools, creating it on first use.
+
+    Args:
+        size: Number of workers. Only honoured when the pool is created.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(size)
+            atexit.register(shutdown_pool)
+
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def run_scripts(codes: List[str], max_workers: Optional[int] = None, timeout: Optional[float] = None,
+                memory_limit: Optional[int] = None,
+                max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS) -> List[str]:
+    """Run several scripts in the worker pool.
+
+    Args:
+        codes: Scripts to execute.
+        max_workers: Size of the pool, see ``get_pool``.
+        timeout: Per-script wall-clock limit in seconds.
+        memory_limit: Per-script memory limit in bytes.
+        max_output_chars: Per-script output bound, see ``BoundedCapture``.
+
+    Returns:
+        The output of each script, in the same order as ``codes``.
+    """
+    return get_pool(max_workers).map(codes, timeout, memory_limit, max_output_chars=max_output_chars)
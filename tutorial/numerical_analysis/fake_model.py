@@ -0,0 +1,89 @@
+import re
+import time
+from textwrap import dedent
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+DEFAULT_SCHEMA_CODE = dedent("""
+    import pandas as pd
+    df = pd.read_csv({file}, encoding='utf-8')
+    df.info()
+    print(df.head(5).to_string())
+""").strip()
+
+DEFAULT_PANDAS_CODE = dedent("""
+    for path in {files}:
+        df = load_csv(path)
+        print(path, df.shape)
+        print(df.describe(include='all').to_string())
+""").strip()
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic chat model that replays canned tool calls and generated code.
+
+    Agent turns are answered from ``tool_calls`` by counting the tool results
+    already in the conversation, so concurrent runs never interfere. Requests
+    from the tools' own code-generation pipelines (recognised by their
+    ``<file>:`` / ``<files>:`` human messages) get ``schema_code`` /
+    ``pandas_code`` with ``{file}`` / ``{files}`` filled in from the prompt.
+
+    Args:
+        tool_calls: Tool calls the agent makes in order, as ``{"name", "args"}`` dicts.
+        schema_code: Code returned to SchemaTool in ``llm`` mode.
+        pandas_code: Code returned to PandasTool.
+        final_answer: Final agent message; defaults to the last tool result.
+        latency: Seconds slept per call, to emulate a remote model.
+    """
+
+    tool_calls: List[Dict[str, Any]] = [
+        {"name": "schema_tool", "args": {}},
+    ]
+    schema_code: str = DEFAULT_SCHEMA_CODE
+    pandas_code: str = DEFAULT_PANDAS_CODE
+    final_answer: Optional[str] = None
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        text = last.text if isinstance(last, HumanMessage) else ""
+
+        file = re.search(r"<file>:\s*(.+)", text)
+        if file:
+            return AIMessage(content=self.schema_code.replace("{file}", repr(file.group(1).strip())))
+
+        files = re.search(r"<files>:\s*(\[.*?\])", text, re.DOTALL)
+        if files:
+            return AIMessage(content=self.pandas_code.replace("{files}", files.group(1)))
+
+        results = [message for message in messages if isinstance(message, ToolMessage)]
+        if len(results) < len(self.tool_calls):
+            call = self.tool_calls[len(results)]
+            return AIMessage(content="", tool_calls=[{"name": call["name"], "args": call.get("args", {}),
+                                                      "id": f"call_{len(results)}"}])
+
+        return AIMessage(content=self.final_answer or (results[-1].text if results else ""))
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+
+        message = self._respond(messages)
+
+        # rough 4-characters-per-token estimate so usage reports are non-zero
+        input_tokens = sum(len(m.text) for m in messages) // 4
+        output_tokens = (len(message.text) + len(str(message.tool_calls))) // 4
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": input_tokens + output_tokens}
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,187 @@
+import difflib
+import os
+import re
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from tutorial.numerical_analysis.cache import DiskCache, file_fingerprint, file_key
+
+NUM_PERM = 64
+SAMPLE_ROWS = 200_000
+# Integer columns are keys only when nearly every row has its own value, or the values look like codes
+MIN_KEY_UNIQUENESS = 0.9
+# Purely numeric pairs also need similar names: unrelated integer ranges overlap easily
+MIN_NUMERIC_NAME_SIMILARITY = 0.5
+
+_rng = np.random.default_rng(20240601)
+# Odd multipliers keep the (wrapping) multiply-xor hashes bijective on uint64.
+_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+_signature_cache = None
+
+
+def _get_signature_cache() -> DiskCache:
+    global _signature_cache
+
+    if _signature_cache is None:
+        _signature_cache = DiskCache("join_index")
+
+    return _signature_cache
+
+
+def minhash_signature(values: np.ndarray, batch: int = 65_536) -> np.ndarray:
+    """MinHash signature of a set of values, computed with vectorized numpy hashing."""
+    hashes = pd.util.hash_array(values.astype(str).astype(object))
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+
+    with np.errstate(over="ignore"):
+        for start in range(0, len(hashes), batch):
+            block = hashes[start:start + batch, None] * _A + _B
+            block ^= block >> np.uint64(29)
+            signature = np.minimum(signature, block.min(axis=0))
+
+    return signature
+
+
+def _column_sketches(path: str) -> Dict[str, Dict]:
+    """Cardinality and MinHash signature of every joinable column of ``path``, cached by fingerprint."""
+    key = file_key(file_fingerprint(path), "join-sketch", 2, NUM_PERM, SAMPLE_ROWS, MIN_KEY_UNIQUENESS)
+
+    cache = _get_signature_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    df = pd.read_csv(path, encoding="utf-8", nrows=SAMPLE_ROWS)
+    sketches = {}
+
+    for name in df.columns:
+        series = df[name]
+        # measures (floats) and constants are not join keys
+        if pd.api.types.is_float_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+
+        values = series.dropna().astype(str).unique()
+        if len(values) < 2:
+            continue
+
+        numeric, code = pd.api.types.is_numeric_dtype(series), _is_code(values)
+        # integer counts and measures are not join keys: keep nearly unique columns and codes
+        if numeric and not code and len(values) < MIN_KEY_UNIQUENESS * series.notna().sum():
+            continue
+
+        sketches[str(name)] = {
+            "cardinality": int(len(values)),
+            "numeric": bool(numeric),
+            "code": bool(code),
+            "signature": minhash_signature(values).tolist(),
+        }
+
+    cache.set(key, sketches)
+
+    return sketches
+
+
+def _is_code(values: np.ndarray) -> bool:
+    """Whether the values have a fixed number (at least 4) of characters, as codes such as 學校代碼 do and counts do not."""
+    lengths = np.char.str_len(np.asarray(values, dtype=str))
+
+    return len(values) > 0 and lengths.min() == lengths.max() >= 4
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[\s_\-()（）]", "", name).lower()
+
+
+def name_similarity(left: str, right: str) -> float:
+    left, right = _normalize(left), _normalize(right)
+
+    if left == right:
+        return 1.0
+
+    return difflib.SequenceMatcher(None, left, right).ratio()
+
+
+def _containment(left: Dict, right: Dict) -> float:
+    """Share of the values of either column found in the other, whichever is lower, estimated from MinHash Jaccard.
+
+    Requiring containment in both directions keeps a small range of values
+    (e.g. counts 0-50) from matching any larger range that happens to include it.
+    """
+    jaccard = float(np.mean(np.array(left["signature"], dtype=np.uint64) ==
+                            np.array(right["signature"], dtype=np.uint64)))
+    total = left["cardinality"] + right["cardinality"]
+    intersection = jaccard / (1 + jaccard) * total
+
+    return min(intersection / max(left["cardinality"], right["cardinality"]), 1.0)
+
+
+def join_candidates(files: List[str], top_k: int = 5, min_score: float = 0.5,
+                    name_weight: float = 0.4) -> List[Dict]:
+    """Rank column pairs across different files by how likely they are to be join keys.
+
+    Only identifier-like columns are considered: text columns, and integer
+    columns that are nearly unique or fixed-width codes. The score mixes
+    column-name similarity with the estimated value containment in both
+    directions; numeric pairs other than two codes must also have similar
+    names. Files with identical
+    column sets are skipped as pairs: they are concatenation candidates, not joins.
+
+    Args:
+        files: Full paths of the CSV files.
+        top_k: Number of candidates returned.
+        min_score: Candidates below this score are dropped.
+        name_weight: Weight of name similarity; value overlap gets the rest.
+
+    Returns:
+        Dicts with ``left``/``right`` as ``(file name, column)``, ``name``,
+        ``overlap`` and ``score``, best first.
+    """
+    sketches = {file: _column_sketches(file) for file in files}
+    candidates = []
+
+    for left_file, right_file in combinations(files, 2):
+        left_columns, right_columns = sketches[left_file], sketches[right_file]
+        if left_columns.keys() == right_columns.keys():
+            continue
+
+        for left_column, left in left_columns.items():
+            for right_column, right in right_columns.items():
+                name = name_similarity(left_column, right_column)
+                # e.g. two row numbers 1..n overlap without being related
+                numeric = left.get("numeric") and right.get("numeric") and not (left.get("code") and right.get("code"))
+                if numeric and name < MIN_NUMERIC_NAME_SIMILARITY:
+                    continue
+
+                overlap = _containment(left, right)
+                score = name_weight * name + (1 - name_weight) * overlap
+
+                if score >= min_score and overlap > 0:
+                    candidates.append({
+                        "left": (os.path.basename(left_file), left_column),
+                        "right": (os.path.basename(right_file), right_column),
+                        "name": round(name, 2),
+                        "overlap": round(overlap, 2),
+                        "score": round(score, 3),
+                    })
+
+    candidates.sort(key=lambda candidate: candidate["score"], reverse=True)
+
+    return candidates[:top_k]
+
+
+def render_join_hints(candidates: List[Dict]) -> Optional[str]:
+    if not candidates:
+        return None
+
+    lines = ["Join hints (column pairs likely to link files):"]
+    for candidate in candidates:
+        (left_file, left_column), (right_file, right_column) = candidate["left"], candidate["right"]
+        lines.append(f"- {left_file}.{left_column} <-> {right_file}.{right_column} "
+                     f"(name {candidate['name']:.2f}, value overlap {candidate['overlap']:.2f})")
+
+    return "\n".join(lines)
@@ -0,0 +1,173 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from tutorial.numerical_analysis.cache import DiskCache, file_fingerprint, get_cache_dir, hash_key, purge_file_entries
+
+# Caches holding entries built with ``file_key``; stale versions are purged from them.
+_FILE_CACHES = ("schema", "join_index", "columnar", "cubes", "shared")
+
+_manifest_cache = None
+
+
+def _get_manifest_cache() -> DiskCache:
+    global _manifest_cache
+
+    if _manifest_cache is None:
+        _manifest_cache = DiskCache("manifest")
+
+    return _manifest_cache
+
+
+class DirectoryChanges(BaseModel):
+    """Difference between a directory's CSV files and the last recorded scan of it."""
+    directory: str
+    first_scan: bool = False
+    added: List[str] = Field(default_factory=list)
+    changed: List[str] = Field(default_factory=list)
+    removed: List[str] = Field(default_factory=list)
+    unchanged: List[str] = Field(default_factory=list)
+
+    @property
+    def affected(self) -> List[str]:
+        """Files whose derived data has to be (re)computed."""
+        return self.added + self.changed
+
+    def describe(self) -> Optional[str]:
+        """One line listing the changes, or ``None`` when there are none worth reporting."""
+        if self.first_scan or not (self.added or self.changed or self.removed):
+            return None
+
+        parts = [f"{label} {', '.join(files)}" for label, files in
+                 (("added", self.added), ("changed", self.changed), ("removed", self.removed)) if files]
+
+        return f"Data files changed in {self.directory} since the last scan: {'; '.join(parts)}"
+
+
+def scan_directory(directory: str) -> Dict[str, List]:
+    """Fingerprint of every CSV file in ``directory``, keyed by file name."""
+    return {name: list(file_fingerprint(os.path.join(directory, name)))
+            for name in sorted(os.listdir(directory)) if name.endswith(".csv")}
+
+
+def refresh_directory(directory: str) -> DirectoryChanges:
+    """Compare ``directory`` with its last scan, purge outdated cache entries and record the new scan.
+
+    Schema profiles, join sketches, columnar shadows, cubes and shared tables
+    of changed and removed files are deleted; entries of unchanged files are
+    left alone. Worker
+    DataFrames and cached results need no purge: they are keyed by
+    fingerprint, so outdated ones are never hit again (see ``load_csv`` and
+    ``PandasTool``).
+    """
+    cache = _get_manifest_cache()
+    key = hash_key("manifest", os.path.abspath(directory))
+
+    previous = cache.get(key)
+    current = scan_directory(directory)
+
+    changes = DirectoryChanges(directory=directory, first_scan=previous is None)
+    previous = previous or {}
+
+    for name, fingerprint in current.items():
+        if name not in previous:
+            changes.added.append(name)
+        elif previous[name] != fingerprint:
+            changes.changed.append(name)
+        else:
+            changes.unchanged.append(name)
+    changes.removed = [name for name in previous if name not in current]
+
+    for name in changes.changed + changes.removed:
+        path = os.path.join(directory, name)
+        fingerprint = tuple(current[name]) if name in current else None
+        for cache_name in _FILE_CACHES:
+            purge_file_entries(get_cache_dir(cache_name), path, fingerprint)
+
+    if current != previous:
+        cache.set(key, current)
+
+    return changes
+
+
+def _warm_file(path: str, join_sketches: bool, columnar: bool):
+    from tutorial.numerical_analysis.profiler import compact_profile, profile_csv
+
+    profile_csv(path)
+    compact_profile(path)
+
+    if join_sketches:
+        from tutorial.numerical_analysis.join_index import _column_sketches
+
+        _column_sketches(path)
+
+    if columnar:
+        from tutorial.numerical_analysis.columnar import read_csv
+
+        read_csv(path)
+
+
+def prewarm(directory: str, join_sketches: bool = True, columnar: bool = False, frames: bool = False,
+            compact_dtypes: bool = False, shared_frames: bool = False, cube_dimensions: Optional[List[List[str]]] = None, max_workers: Optional[int] = None,
+            pool_size: Optional[int] = None) -> DirectoryChanges:
+    """Fill the caches for ``directory`` before the first question arrives.
+
+    Profiles (``native`` and ``compact`` schema modes), join sketches and,
+    optionally, columnar shadows are built for every CSV file; unchanged files
+    are cache hits, so only new and edited files are actually parsed. With
+    ``frames`` every pool worker also loads each file into its ``load_csv``
+    cache.
+
+    Args:
+        directory: Data directory, as in ``Context.directory``.
+        join_sketches: Build the MinHash sketches used by ``SchemaTool(join_hints=True)``.
+        columnar: Write the columnar shadows used by ``PandasTool(columnar_cache=True)``.
+        frames: Start the worker pool and parse every file in each worker.
+        compact_dtypes: Load the frames with compact dtypes, matching ``PandasTool.compact_dtypes``,
+            and print the memory each file takes.
+        shared_frames: Publish the shared Arrow copies used by ``PandasTool.shared_frames``
+            first, so workers attach to them instead of each parsing the files.
+        cube_dimensions: Dimension sets to pre-aggregate, see ``PandasTool.cube_dimensions``.
+        max_workers: Threads used to build the disk caches.
+        pool_size: Size of the worker pool, see ``get_pool``.
+
+    Returns:
+        The changes found since the last scan of ``directory``.
+    """
+    start = time.perf_counter()
+    changes = refresh_directory(directory)
+    paths = [os.path.join(directory, name) for name in changes.affected + changes.unchanged]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda path: _warm_file(path, join_sketches, columnar), paths))
+
+    if cube_dimensions:
+        from tutorial.numerical_analysis.cubes import materialize
+
+        materialize(paths, cube_dimensions, max_workers=max_workers)
+
+    if shared_frames:
+        from tutorial.numerical_analysis.shared import publish
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda path: publish(path, compact_dtypes), paths))
+
+    if frames and paths:
+        from tutorial.numerical_analysis.execution import get_pool
+
+        code = f"for path in {paths!r}:\n    load_csv(path)\n"
+        if compact_dtypes:
+            code += "print(frame_cache_report())"
+
+        outputs = get_pool(pool_size).broadcast(code, compact_dtypes=compact_dtypes, shared_frames=shared_frames)
+        if compact_dtypes:
+            # every worker holds the same frames
+            print(outputs[0])
+
+    print(f"Pre-warmed {len(paths)} files in {directory} in {time.perf_counter() - start:.2f}s "
+          f"({len(changes.affected)} new or changed, {len(changes.removed)} removed)")
+
+    return changes
@@ -0,0 +1,214 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Annotated, Any, Dict, List, Literal, Optional, Tuple, Union
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+from tutorial.numerical_analysis.cache import file_fingerprint, hash_key
+from tutorial.numerical_analysis import columnar
+
+AggFunc = Literal["sum", "count", "mean", "min", "max", "median", "nunique"]
+
+
+class Condition(BaseModel):
+    column: str = Field(description="Column to test")
+    op: Literal["==", "!=", ">", ">=", "<", "<=", "in", "not in", "contains"] = Field(description="Comparison operator")
+    value: Any = Field(description="Value to compare with; a list for 'in' / 'not in'")
+
+
+class FilterStep(BaseModel):
+    op: Literal["filter"]
+    conditions: List[Condition] = Field(description="Row conditions, combined with AND")
+
+
+class SelectStep(BaseModel):
+    op: Literal["select"]
+    columns: List[str] = Field(description="Columns to keep")
+
+
+class GroupByStep(BaseModel):
+    op: Literal["groupby"]
+    by: List[str] = Field(description="Columns to group by")
+    agg: Dict[str, List[AggFunc]] = Field(description="Column -> aggregations; output columns are named '<column>_<aggregation>'")
+
+
+class AggStep(BaseModel):
+    op: Literal["agg"]
+    agg: Dict[str, List[AggFunc]] = Field(description="Column -> aggregations over the whole table; output is one row with '<column>_<aggregation>' columns")
+
+
+class JoinStep(BaseModel):
+    op: Literal["join"]
+    right: "QueryPlan" = Field(description="Plan producing the right-hand table")
+    on: List[str] = Field(description="Key columns present in both tables")
+    how: Literal["inner", "left", "right", "outer"] = "inner"
+
+
+class SortStep(BaseModel):
+    op: Literal["sort"]
+    by: List[str]
+    ascending: bool = True
+
+
+class PivotStep(BaseModel):
+    op: Literal["pivot"]
+    index: List[str] = Field(description="Columns that become rows")
+    columns: str = Field(description="Column whose values become new columns")
+    values: str = Field(description="Column to aggregate into the cells")
+    aggfunc: AggFunc = "sum"
+
+
+class HeadStep(BaseModel):
+    op: Literal["head"]
+    n: int = 10
+
+
+Step = Union[FilterStep, SelectStep, GroupByStep, AggStep, JoinStep, SortStep, PivotStep, HeadStep]
+
+
+class QueryPlan(BaseModel):
+    source: str = Field(description="CSV file name (without directory path) the plan starts from")
+    steps: List[Annotated[Step, Field(discriminator="op")]] = Field(default_factory=list,
+                                                                   description="Operations applied in order")
+
+
+JoinStep.model_rebuild()
+
+
+def _filter(df: pd.DataFrame, step: FilterStep) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+
+    for condition in step.conditions:
+        column, value = df[condition.column], condition.value
+
+        if condition.op == "in":
+            mask &= column.isin(value)
+        elif condition.op == "not in":
+            mask &= ~column.isin(value)
+        elif condition.op == "contains":
+            mask &= column.astype(str).str.contains(str(value), regex=False, na=False)
+        else:
+            mask &= {
+                "==": column.__eq__, "!=": column.__ne__, ">": column.__gt__,
+                ">=": column.__ge__, "<": column.__lt__, "<=": column.__le__,
+            }[condition.op](value)
+
+    return df[mask]
+
+
+def _flatten(columns) -> List[str]:
+    return ["_".join(str(level) for level in column if str(level)) if isinstance(column, tuple) else str(column)
+            for column in columns]
+
+
+def _apply(df: pd.DataFrame, step: Step, right: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    if isinstance(step, FilterStep):
+        return _filter(df, step)
+
+    if isinstance(step, SelectStep):
+        return df[step.columns]
+
+    if isinstance(step, GroupByStep):
+        result = df.groupby(step.by, dropna=False, observed=True).agg(step.agg)
+        result.columns = _flatten(result.columns)
+        return result.reset_index()
+
+    if isinstance(step, AggStep):
+        return pd.DataFrame([{f"{column}_{func}": df[column].agg(func)
+                              for column, funcs in step.agg.items() for func in funcs}])
+
+    if isinstance(step, JoinStep):
+        return df.merge(right, on=step.on, how=step.how)
+
+    if isinstance(step, SortStep):
+        return df.sort_values(step.by, ascending=step.ascending)
+
+    if isinstance(step, PivotStep):
+        result = pd.pivot_table(df, index=step.index, columns=step.columns, values=step.values,
+                                aggfunc=step.aggfunc, observed=True)
+        result.columns = _flatten(result.columns)
+        return result.reset_index()
+
+    if isinstance(step, HeadStep):
+        return df.head(step.n)
+
+    raise ValueError(f"Unknown step: {step}")
+
+
+def has_unbounded_steps(plan: QueryPlan) -> bool:
+    """Whether ``plan`` joins or pivots, whose output can be far larger than their inputs."""
+    return any(isinstance(step, (JoinStep, PivotStep)) for step in plan.steps)
+
+
+class PlanExecutor:
+    """Runs ``QueryPlan`` objects with vectorized pandas operations, no ``exec``.
+
+    Every intermediate frame is memoized under a key derived from the source
+    file fingerprint and the steps that produced it, so plans sharing a prefix
+    (the same filtered table, the same join) reuse each other's work across
+    questions. Editing a source file changes its fingerprint and therefore
+    every key built on it.
+
+    Args:
+        max_frames: Number of intermediate frames kept, least recently used first out.
+        columnar: Read sources through memory-mapped Feather shadow copies
+            (see ``tutorial.numerical_analysis.columnar``) instead of parsing the CSV.
+    """
+
+    def __init__(self, max_frames: int = 32, columnar: bool = False):
+        self.max_frames = max_frames
+        self.columnar = columnar
+        self._frames: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key]
+
+        return None
+
+    def _store(self, key: str, df: pd.DataFrame):
+        with self._lock:
+            self._frames[key] = df
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+
+    def _evaluate(self, plan: QueryPlan, directory: str) -> Tuple[str, pd.DataFrame]:
+        path = os.path.join(directory, plan.source)
+        key = hash_key("plan-source", file_fingerprint(path))
+
+        df = self._lookup(key)
+        if df is None:
+            df = columnar.read_csv(path) if self.columnar else pd.read_csv(path, encoding="utf-8")
+            self._store(key, df)
+
+        for step in plan.steps:
+            right_key, right = self._evaluate(step.right, directory) if isinstance(step, JoinStep) else (None, None)
+            key = hash_key("plan-step", key, step.model_dump(exclude={"right"}), right_key)
+
+            cached = self._lookup(key)
+            if cached is None:
+                cached = _apply(df, step, right)
+                self._store(key, cached)
+            df = cached
+
+        return key, df
+
+    def execute(self, plan: QueryPlan, directory: str) -> pd.DataFrame:
+        """Evaluate ``plan`` against the CSV files in ``directory``."""
+        return self._evaluate(plan, directory)[1]
+
+
+_worker_executors: Dict[bool, PlanExecutor] = {}
+
+
+def worker_executor(columnar: bool = False) -> PlanExecutor:
+    """The ``PlanExecutor`` of this process, so plans run by a worker share its memoized frames."""
+    if columnar not in _worker_executors:
+        _worker_executors[columnar] = PlanExecutor(columnar=columnar)
+
+    return _worker_executors[columnar]
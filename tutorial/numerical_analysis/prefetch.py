@@ -0,0 +1,40 @@
+from typing import Any, Dict, Optional
+
+from langchain.agents.middleware import AgentMiddleware
+
+from tutorial.numerical_analysis.tools import Context, SchemaTool
+
+
+class SchemaPrefetchMiddleware(AgentMiddleware):
+    """Starts ``schema_tool`` for the run's context as soon as the run starts.
+
+    The agent instructions make the schema the first step, so extraction runs
+    in parallel with the first model call and the tool hands the result over
+    when the model asks for it, instead of the two running one after the other.
+    A prefetch the run did not use is discarded when the run ends.
+
+    Args:
+        schema_tool: The ``SchemaTool`` registered with the agent.
+    """
+
+    def __init__(self, schema_tool: SchemaTool):
+        super().__init__()
+        self.schema_tool = schema_tool
+
+    def before_agent(self, state, runtime) -> Optional[Dict[str, Any]]:
+        if isinstance(runtime.context, Context):
+            self.schema_tool.prefetch(runtime.context)
+
+        return None
+
+    async def abefore_agent(self, state, runtime) -> Optional[Dict[str, Any]]:
+        return self.before_agent(state, runtime)
+
+    def after_agent(self, state, runtime) -> Optional[Dict[str, Any]]:
+        if isinstance(runtime.context, Context):
+            self.schema_tool.discard_prefetch(runtime.context)
+
+        return None
+
+    async def aafter_agent(self, state, runtime) -> Optional[Dict[str, Any]]:
+        return self.after_agent(state, runtime)
@@ -0,0 +1,129 @@
+from typing import Callable, Dict, List, Literal, Optional, Type
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+Aggregation = Literal["sum", "mean", "count", "min", "max", "median"]
+
+
+def _filter(df: pd.DataFrame, query: Optional[str]) -> pd.DataFrame:
+    return df.query(query) if query else df
+
+
+def yoy_change(df: pd.DataFrame, year: str, value: str, by: Optional[List[str]] = None,
+               agg: str = "sum", query: Optional[str] = None) -> pd.DataFrame:
+    """Aggregate ``value`` per year (and group) with the absolute and relative change from the previous year."""
+    by = list(by or [])
+    totals = (_filter(df, query).groupby(by + [year], observed=True)[value].agg(agg)
+              .reset_index().sort_values(by + [year], ignore_index=True))
+
+    previous = totals.groupby(by, observed=True)[value].shift() if by else totals[value].shift()
+    totals["change"] = totals[value] - previous
+    totals["pct_change"] = totals["change"] / previous
+
+    return totals
+
+
+def top_n(df: pd.DataFrame, value: str, n: int = 5, by: Optional[List[str]] = None,
+          label: Optional[List[str]] = None, agg: str = "sum", ascending: bool = False,
+          query: Optional[str] = None) -> pd.DataFrame:
+    """Rows with the ``n`` largest (or smallest) ``value`` within each ``by`` group.
+
+    With ``label`` the data is first aggregated per ``by`` + ``label``, e.g.
+    the top schools per city by total students over several years.
+    """
+    by = list(by or [])
+    df = _filter(df, query)
+
+    if label:
+        df = df.groupby(by + list(label), observed=True)[value].agg(agg).reset_index()
+
+    df = df.sort_values(value, ascending=ascending, kind="stable")
+    top = df.groupby(by, observed=True, sort=False).head(n) if by else df.head(n)
+
+    return top.sort_values(by + [value], ascending=[True] * len(by) + [ascending], kind="stable",
+                           ignore_index=True)
+
+
+def share_of_total(df: pd.DataFrame, value: str, by: List[str], within: Optional[List[str]] = None,
+                   agg: str = "sum", query: Optional[str] = None) -> pd.DataFrame:
+    """Aggregate ``value`` per ``by`` group and its share of the total, or of the total within each ``within`` group."""
+    within = [column for column in (within or []) if column not in by]
+    totals = _filter(df, query).groupby(within + list(by), observed=True)[value].agg(agg).reset_index()
+
+    total = totals.groupby(within, observed=True)[value].transform("sum") if within else totals[value].sum()
+    totals["share"] = totals[value] / total
+
+    return totals
+
+
+def pivot_by_year(df: pd.DataFrame, index: List[str], year: str, value: str, agg: str = "sum",
+                  query: Optional[str] = None) -> pd.DataFrame:
+    """Aggregate ``value`` with one row per ``index`` group and one column per year."""
+    return _filter(df, query).pivot_table(index=list(index), columns=year, values=value, aggfunc=agg,
+                                          observed=True)
+
+
+class PrimitiveInputs(BaseModel):
+    files: List[str] = Field(
+        description="CSV file names (without directory path) to analyse; several files, e.g. one per year, are concatenated")
+    query: Optional[str] = Field(default=None,
+                                 description="Optional pandas DataFrame.query filter applied first, e.g. \"縣市 == '臺中市'\"")
+
+
+class YoYInputs(PrimitiveInputs):
+    year: str = Field(description="Year column")
+    value: str = Field(description="Numeric column to aggregate")
+    by: Optional[List[str]] = Field(default=None, description="Columns to compare separately, e.g. per city")
+    agg: Aggregation = Field(default="sum", description="How values are aggregated per year")
+
+
+class TopNInputs(PrimitiveInputs):
+    value: str = Field(description="Numeric column to rank by")
+    n: int = Field(default=5, description="Rows kept per group")
+    by: Optional[List[str]] = Field(default=None, description="Rank within each group of these columns")
+    label: Optional[List[str]] = Field(default=None,
+                                       description="Aggregate per these columns first (e.g. school name), then rank")
+    agg: Aggregation = Field(default="sum", description="Aggregation used with label")
+    ascending: bool = Field(default=False, description="Rank smallest first")
+
+
+class ShareInputs(PrimitiveInputs):
+    value: str = Field(description="Numeric column to aggregate")
+    by: List[str] = Field(description="Groups whose share is computed")
+    within: Optional[List[str]] = Field(default=None,
+                                        description="Compute shares within each group of these columns, e.g. per year")
+    agg: Aggregation = Field(default="sum", description="How values are aggregated per group")
+
+
+class PivotInputs(PrimitiveInputs):
+    index: List[str] = Field(description="Row groups")
+    year: str = Field(description="Year column, one output column per year")
+    value: str = Field(description="Numeric column to aggregate")
+    agg: Aggregation = Field(default="sum", description="How values are aggregated per cell")
+
+
+class Primitive(BaseModel):
+    function: Callable
+    inputs: Type[PrimitiveInputs]
+    description: str
+
+
+PRIMITIVES: Dict[str, Primitive] = {
+    "yoy_change_tool": Primitive(
+        function=yoy_change, inputs=YoYInputs,
+        description="Year-over-year change: aggregates a numeric column per year (optionally per group) and "
+                    "returns each year's value with its absolute and percentage change from the previous year."),
+    "top_n_tool": Primitive(
+        function=top_n, inputs=TopNInputs,
+        description="Top-N per group: returns the N rows with the largest (or smallest) value overall or within "
+                    "each group, optionally aggregating per label columns first."),
+    "share_of_total_tool": Primitive(
+        function=share_of_total, inputs=ShareInputs,
+        description="Share of total: aggregates a numeric column per group and returns each group's share of the "
+                    "overall total, or of the total within another grouping such as the year."),
+    "pivot_by_year_tool": Primitive(
+        function=pivot_by_year, inputs=PivotInputs,
+        description="Pivot by year: aggregates a numeric column into a table with one row per group and one "
+                    "column per year."),
+}
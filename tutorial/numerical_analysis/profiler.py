@@ -0,0 +1,236 @@
+import io
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from tutorial.numerical_analysis.cache import DiskCache, file_fingerprint, file_key
+
+# Bump when the rendered summary changes so stale cache entries are ignored.
+PROFILE_VERSION = 1
+
+_schema_cache = None
+
+
+def _get_schema_cache() -> DiskCache:
+    global _schema_cache
+
+    if _schema_cache is None:
+        _schema_cache = DiskCache("schema")
+
+    return _schema_cache
+
+
+def count_rows(path: str) -> int:
+    """Count data rows by scanning for newlines, without parsing the CSV.
+
+    Quoted fields spanning several lines are counted more than once, so the
+    result is an estimate for such files.
+    """
+    lines = 0
+    last = b"\n"
+
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+
+    if last != b"\n":
+        lines += 1
+
+    # header line
+    return max(lines - 1, 0)
+
+
+def _read_sample(path: str, size: int, sample_rows: int, large_file_bytes: int) -> Tuple[pd.DataFrame, bool]:
+    """Parse the whole file, or only its first ``sample_rows`` rows when it is large.
+
+    Returns:
+        The frame, and whether it is a sample rather than the full file.
+    """
+    if size <= large_file_bytes:
+        return pd.read_csv(path, encoding="utf-8"), False
+
+    df = pd.read_csv(path, encoding="utf-8", nrows=sample_rows)
+
+    return df, len(df) == sample_rows
+
+
+def profile_csv(path: str, sample_rows: int = 100_000, large_file_bytes: int = 50 * 1024 * 1024) -> str:
+    """Summarise a CSV file the way ``df.info()`` + ``df.head(5)`` would, without an LLM.
+
+    Files above ``large_file_bytes`` are only partially parsed: dtypes and
+    non-null counts come from the first ``sample_rows`` rows and the total row
+    count from a newline scan. Results are cached on disk keyed by the file's
+    (path, size, mtime), so unchanged files are never parsed twice.
+
+    Args:
+        path: Full path of the CSV file.
+        sample_rows: Number of rows parsed for dtype inference on large files.
+        large_file_bytes: Size above which sampling kicks in.
+
+    Returns:
+        The structure summary followed by the first five rows.
+    """
+    fingerprint = file_fingerprint(path)
+    key = file_key(fingerprint, "profile", PROFILE_VERSION, sample_rows, large_file_bytes)
+
+    cache = _get_schema_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    df, sampled = _read_sample(path, fingerprint[1], sample_rows, large_file_bytes)
+
+    buffer = io.StringIO()
+
+    if sampled:
+        buffer.write(f"(dtypes and non-null counts inferred from the first {sample_rows} "
+                     f"of ~{count_rows(path)} rows)\n")
+
+    df.info(buf=buffer)
+    buffer.write(df.head(5).to_string())
+    buffer.write("\n")
+
+    summary = buffer.getvalue()
+    cache.set(key, summary)
+
+    return summary
+
+
+def compact_profile(path: str, sample_rows: int = 100_000, large_file_bytes: int = 50 * 1024 * 1024) -> Dict:
+    """Per-column statistics for ``render_schema_summary``, cached like ``profile_csv``.
+
+    Returns:
+        ``{"file", "rows", "sampled", "columns": [{"name", "dtype", "null_ratio", "cardinality", "samples"}]}``;
+        null ratios and cardinalities come from the sample on large files.
+    """
+    fingerprint = file_fingerprint(path)
+    key = file_key(fingerprint, "compact", PROFILE_VERSION, sample_rows, large_file_bytes)
+
+    cache = _get_schema_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    df, sampled = _read_sample(path, fingerprint[1], sample_rows, large_file_bytes)
+
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        samples = series.dropna().drop_duplicates().head(2)
+        columns.append({
+            "name": str(name),
+            "dtype": str(series.dtype),
+            "null_ratio": round(float(series.isna().mean()), 3) if len(series) else 0.0,
+            "cardinality": int(series.nunique()),
+            "samples": [str(value) for value in samples],
+        })
+
+    profile = {
+        "file": os.path.basename(path),
+        "rows": count_rows(path) if sampled else len(df),
+        "sampled": sampled,
+        "columns": columns,
+    }
+    cache.set(key, profile)
+
+    return profile
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:  # not installed, or the encoding cannot be downloaded offline
+        print(f"tiktoken encoding {encoding_name} unavailable ({str(e)}), estimating tokens from characters")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    """Number of tokens of ``text``, estimated from its length when tiktoken is unavailable.
+
+    The estimate is one token per three UTF-8 bytes: about one per Chinese
+    character and a little over the real count for English, so a summary
+    that fits the estimate also fits the budget.
+    """
+    encoding = _get_encoding(encoding_name)
+
+    if encoding is None:
+        return -(-len(text.encode("utf-8")) // 3)
+
+    return len(encoding.encode(text))
+
+
+# Detail levels tried in order until the summary fits the budget.
+_DETAIL_LEVELS = ("full", "stats", "names")
+
+
+def _render_column(column: Dict, detail: str) -> str:
+    line = f"{column['name']}:{column['dtype']}"
+
+    if detail in ("full", "stats"):
+        line += f" null={column['null_ratio']:.0%} card={column['cardinality']}"
+    if detail == "full" and column["samples"]:
+        line += " e.g. " + " | ".join(sample[:30] for sample in column["samples"])
+
+    return line
+
+
+def _render_group(files: List[Dict], columns: List[Dict], detail: str, max_columns: Optional[int] = None) -> str:
+    header = ", ".join(f"{profile['file']} ({'~' if profile['sampled'] else ''}{profile['rows']} rows)"
+                       for profile in files)
+    shown = columns if max_columns is None else columns[:max_columns]
+
+    lines = [f"## {header}"] + [_render_column(column, detail) for column in shown]
+    if len(shown) < len(columns):
+        lines.append(f"... (+{len(columns) - len(shown)} more columns)")
+
+    return "\n".join(lines)
+
+
+def render_schema_summary(profiles: List[Dict], max_tokens: int = 2000,
+                          encoding_name: str = "cl100k_base") -> str:
+    """Render ``compact_profile`` results as one summary that fits in ``max_tokens``.
+
+    Files with identical columns and dtypes (e.g. one CSV per year) share a
+    single column listing. If the summary is still too long, sample values and
+    then statistics are dropped, and finally each group is cut to an equal
+    share of the budget, listing only its first columns.
+
+    Args:
+        profiles: Output of ``compact_profile`` for each file.
+        max_tokens: Token ceiling for the whole summary.
+        encoding_name: tiktoken encoding used to count tokens (see ``count_tokens``).
+    """
+    groups: "OrderedDict[Tuple, List[Dict]]" = OrderedDict()
+    for profile in profiles:
+        signature = tuple((column["name"], column["dtype"]) for column in profile["columns"])
+        groups.setdefault(signature, []).append(profile)
+
+    # columns of the first file of each group carry the stats and samples
+    groups = [(files, files[0]["columns"]) for files in groups.values()]
+
+    for detail in _DETAIL_LEVELS:
+        summary = "\n\n".join(_render_group(files, columns, detail) for files, columns in groups)
+        if count_tokens(summary, encoding_name) <= max_tokens:
+            return summary
+
+    share = max_tokens // max(len(groups), 1)
+    rendered = []
+    for files, columns in groups:
+        low, high = 0, len(columns)
+        # largest number of columns whose rendering fits the group's share
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(_render_group(files, columns, "names", middle), encoding_name) <= share:
+                low = middle
+            else:
+                high = middle - 1
+        rendered.append(_render_group(files, columns, "names", low))
+
+    return "\n\n".join(rendered)
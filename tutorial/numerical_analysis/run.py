@@ -1,4 +1,6 @@
-﻿import os
+﻿import argparse
+import os
+import time
 from textwrap import dedent
 
 from langchain.agents import create_agent
@@ -8,11 +10,15 @@ from langchain.agents.middleware.model_call_limit import ModelCallLimitMiddlewar
 from langchain_core.messages import HumanMessage
 
 from initialization import credential_init
-from tutorial.numerical_analysis.tools import SchemaTool, PandasTool, Context
+from tutorial.numerical_analysis.batch import load_questions, print_report, run_batch, write_records
+from tutorial.numerical_analysis.cache import LRUCache
+from tutorial.numerical_analysis.fake_model import ScriptedChatModel
+from tutorial.numerical_analysis.manifest import prewarm
+from tutorial.numerical_analysis.prefetch import SchemaPrefetchMiddleware
+from tutorial.numerical_analysis.tools import (ArtifactTool, SchemaTool, PandasTool, Context, build_primitive_tools,
+                                              list_context_files)
 from src.path.path_definition import get_project_dir
 
-credential_init()
-
 
 AGENT_INSTRUCTION_VERSION_2 = dedent("""
 # Role
@@ -24,30 +30,33 @@ AGENT_INSTRUCTION_VERSION_2 = dedent("""
 # Tool
 你可以使用以下工具來完成任務：
 
-- **schema_tool**: 讀取指定目錄中的所有 CSV 檔案，返回每個檔案的結構摘要（欄位名稱、資料型別、非空值數量）與前五筆範例資料。注意：此工具僅提供結構資訊與極少量範例，無法用於統計、篩選或計算。
-- **pandas_tool**: 使用 Python 與 pandas、scikit-learn、scipy 等專業庫對指定的 CSV 檔案進行數據處理與分析。支援篩選、分組、聚合、合併、統計檢定、機器學習建模等操作。這是唯一能對資料進行實際計算與分析的工具。
+- **schema_tool**: 讀取指定目錄中的所有 CSV 檔案，返回一份精簡的結構摘要：欄位相同的檔案合併列出，每個欄位附上資料型別、缺值比例（null）、相異值數量（card）與最多 2 個範例值（e.g.）。注意：此工具僅提供結構資訊與極少量範例值，無法用於統計、篩選或計算。
+- **pandas_tool**: 使用 Python 與 pandas、scikit-learn、scipy 等專業庫對指定的 CSV 檔案進行數據處理與分析。支援篩選、分組、聚合、合併、統計檢定、機器學習建模等操作。
+- **yoy_change_tool** / **top_n_tool** / **share_of_total_tool** / **pivot_by_year_tool**: 預先寫好的常用分析（年增率、各組前 N 名、佔比、依年度樞紐），直接以參數呼叫，不需生成程式碼，速度比 pandas_tool 快。
+- **artifact_tool**: 工具輸出過長被截斷時（顯示 "full output saved as artifact <id>"），以 artifact id 與行數範圍分段讀取完整輸出，不需重新執行分析。
 
 # Input
 使用者會以自然語言描述他們的數據分析需求或問題。
 
 # Rule
 - 第一步：調用 `schema_tool` 了解有哪些檔案、每個檔案的欄位結構與資料型別
-- 第二步：根據 schema_tool 返回的欄位資訊，調用 `pandas_tool` 對相關檔案進行實際的數據處理與分析
-- 重要：schema_tool 僅提供結構與 5 筆範例，任何涉及篩選、統計、聚合、計數、排序、建模的操作都必須透過 pandas_tool 完成
-- 調用 pandas_tool 時，從 schema_tool 的結果中選取相關的檔案名稱傳入
+- 第二步：根據 schema_tool 返回的欄位資訊，需求屬於年增率、前 N 名、佔比或依年度樞紐時，優先調用對應的預建分析工具；其他需求調用 `pandas_tool` 對相關檔案進行實際的數據處理與分析
+- 重要：schema_tool 僅提供結構與少量範例值，任何涉及篩選、統計、聚合、計數、排序、建模的操作都必須透過 pandas_tool 或預建分析工具完成
+- 調用 pandas_tool 或預建分析工具時，從 schema_tool 的結果中選取相關的檔案名稱傳入
+- 若 schema_tool 的結果包含 Join hints，需要合併多個檔案時優先使用其中列出的欄位作為合併鍵，並在 pandas_tool 的 context 中註明
 - 若工具返回錯誤，如實告知使用者並建議檢查檔案格式或需求描述
 
 # Constraints
 - 嚴禁在未調用工具的情況下憑空猜測資料內容
-- 嚴禁僅憑 schema_tool 的 5 筆範例資料就回答需要統計或計算的問題
+- 嚴禁僅憑 schema_tool 的範例值或缺值比例、相異值數量就回答需要統計或計算的問題
 - 嚴禁對資料進行任何寫入、修改或刪除操作
-- 回答必須基於 pandas_tool 的實際計算結果，不得虛構
+- 回答必須基於 pandas_tool 或預建分析工具的實際計算結果，不得虛構
 
 # 推理與行動（ReAct）
 使用「推理 → 行動 → 觀察」的循環方式工作，每一步都先思考再決定是否呼叫工具：
 
 - **推理**：分析使用者需求與目前已取得的資料，判斷下一步該做什麼。問自己：「我現在擁有的資訊是否已經足以完整回答使用者的問題？」
-- **行動**：若資訊不足，呼叫對應的工具（schema_tool 或 pandas_tool）來獲取更多資料
+- **行動**：若資訊不足，呼叫對應的工具（schema_tool、預建分析工具或 pandas_tool）來獲取更多資料
 - **觀察**：仔細閱讀工具回傳的結果，提取關鍵資訊，然後回到推理步驟
 
 ## 停止條件
@@ -60,37 +69,93 @@ AGENT_INSTRUCTION_VERSION_2 = dedent("""
 """)
 
 
-llm = ChatOllama(model='deepseek-v4-pro:cloud',
-                 base_url='https://ollama.com',
-                 name='main', temperature=0)
-
-
-tools = [SchemaTool.create(llm=llm),
-         PandasTool.create(llm=llm)]
-
-agent = create_agent(
-    model=llm,
-    name="analysis_agent_version_2",
-    tools=tools,
-    system_prompt=AGENT_INSTRUCTION_VERSION_2,
-    middleware=[
-        ToolRetryMiddleware(max_retries=2),
-        ModelCallLimitMiddleware(run_limit=25, exit_behavior="end"),
-    ]
-)
-
-# Case 1
-
-# context = Context(directory=os.path.join(get_project_dir(), "tutorial", "numerical_analysis"))
-#
-# agent_input = {"messages": HumanMessage(content="顯示外國學生數量")}
-# agent_result = agent.invoke(agent_input, context=context)
-
-# Case 2:
-
-context = Context(directory=os.path.join(get_project_dir(), "tutorial", "numerical_analysis", "多檔案測試"))
-
-agent_input = {"messages": HumanMessage(content="台中市學生數量從2021年到2024年的變化")}
-agent_result = agent.invoke(agent_input, context=context)
-
-print("")
+def build_agent(llm, cache: bool = True):
+
+    schema_tool = SchemaTool.create(llm=llm, mode="compact", max_tokens=2000, join_hints=True)
+
+    tools = [schema_tool,
+             PandasTool.create(llm=llm,
+                               code_cache=LRUCache("pandas_code") if cache else None,
+                               result_cache=LRUCache("pandas_result") if cache else None),
+             *build_primitive_tools(result_cache=LRUCache("primitive_result") if cache else None),
+             ArtifactTool()]
+
+    return create_agent(
+        model=llm,
+        name="analysis_agent_version_2",
+        tools=tools,
+        system_prompt=AGENT_INSTRUCTION_VERSION_2,
+        middleware=[
+            # the schema is always the first step: extract it while the model decides to ask for it
+            SchemaPrefetchMiddleware(schema_tool),
+            ToolRetryMiddleware(max_retries=2),
+            ModelCallLimitMiddleware(run_limit=25, exit_behavior="end"),
+        ]
+    )
+
+
+def build_llm():
+    credential_init()
+
+    return ChatOllama(model='deepseek-v4-pro:cloud',
+                      base_url='https://ollama.com',
+                      name='main', temperature=0)
+
+
+if __name__ == "__main__":
+    # the tools run code in spawned worker processes, which re-import this module: the model
+    # and the agent are only built here, never at import time
+
+    parser = argparse.ArgumentParser(description="Numerical analysis agent")
+    parser.add_argument("--questions", help="file with one question per line; runs them as a batch")
+    parser.add_argument("--directory", default=os.path.join(get_project_dir(), "tutorial", "numerical_analysis", "多檔案測試"))
+    parser.add_argument("--partitions", nargs="+",
+                        help="sub-directories or glob patterns under --directory holding shards of one dataset, e.g. '*/'")
+    parser.add_argument("--concurrency", type=int, default=4, help="questions answered at the same time")
+    parser.add_argument("--output", help="write per-question results as JSON lines")
+    parser.add_argument("--fake-model", action="store_true",
+                        help="replay canned tool calls and code instead of calling the model (offline runs)")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="build the schema caches and load every file into the workers before answering")
+    args = parser.parse_args()
+
+    context = Context(directory=args.directory, partitions=args.partitions)
+    paths = list_context_files(context)
+
+    if args.prewarm:
+        for directory in dict.fromkeys(os.path.dirname(path) for path in paths):
+            prewarm(directory, frames=True)
+
+    if args.fake_model:
+        files = [os.path.relpath(path, args.directory) for path in paths]
+        agent = build_agent(ScriptedChatModel(tool_calls=[
+            {"name": "schema_tool", "args": {}},
+            {"name": "pandas_tool", "args": {"files": files, "context": "describe every file"}},
+        ]), cache=False)  # keep canned code out of the shared code cache
+    else:
+        agent = build_agent(build_llm())
+
+    if args.questions:
+        questions = load_questions(args.questions)
+
+        start = time.perf_counter()
+        records = run_batch(agent, questions, context, max_concurrency=args.concurrency)
+        print_report(records, time.perf_counter() - start)
+
+        if args.output:
+            write_records(records, args.output)
+
+    else:
+        # Case 1
+
+        # context = Context(directory=os.path.join(get_project_dir(), "tutorial", "numerical_analysis"))
+        #
+        # agent_input = {"messages": HumanMessage(content="顯示外國學生數量")}
+        # agent_result = agent.invoke(agent_input, context=context)
+
+        # Case 2:
+
+        agent_input = {"messages": HumanMessage(content="台中市學生數量從2021年到2024年的變化")}
+        agent_result = agent.invoke(agent_input, context=context)
+
+        print("")
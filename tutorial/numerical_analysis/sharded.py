@@ -0,0 +1,68 @@
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+
+from tutorial.numerical_analysis.chunked import DEFAULT_CHUNKSIZE, _prepare, combine_partials, partial_groupby
+
+
+def expand_partitions(directory: str, partitions: List[str]) -> List[str]:
+    """Full paths of the CSV files selected by ``partitions``.
+
+    Each entry is a directory, a CSV file or a glob pattern matching either,
+    relative to ``directory`` unless absolute (e.g. ``"*/"`` for one
+    sub-directory per city). Files are returned once each, in pattern order.
+    """
+    paths = []
+
+    for pattern in partitions:
+        for match in sorted(glob.glob(os.path.join(directory, pattern))):
+            if os.path.isdir(match):
+                paths.extend(os.path.join(match, name) for name in sorted(os.listdir(match)) if name.endswith(".csv"))
+            elif match.endswith(".csv"):
+                paths.append(match)
+
+    return list(dict.fromkeys(os.path.normpath(path) for path in paths))
+
+
+def sharded_groupby(paths: List[str],
+                    by: Union[str, List[str], None],
+                    agg: Dict[str, Union[str, List[str]]],
+                    query: Optional[str] = None,
+                    max_workers: Optional[int] = None,
+                    chunksize: int = DEFAULT_CHUNKSIZE,
+                    **kwargs) -> pd.DataFrame:
+    """Group and aggregate a dataset split over several CSV files (shards).
+
+    Every shard is reduced to the per-group sum/count/min/max the aggregations
+    need in its own process, chunk by chunk as in ``chunked_groupby``, and only
+    these small partials are merged, so no process ever holds more than one
+    chunk of one shard.
+
+    Args:
+        paths: Full paths of the shards; they must share the grouped and aggregated columns.
+        by: Column(s) to group by; ``None`` aggregates everything.
+        agg: Column -> aggregation(s), from ``sum``, ``count``, ``mean``, ``min``, ``max``.
+        query: Optional ``DataFrame.query`` filter applied to every chunk first.
+        max_workers: Processes used; defaults to one per shard, up to the CPU count.
+        chunksize: Rows parsed per chunk.
+        **kwargs: Passed to ``pd.read_csv``.
+
+    Returns:
+        One row per group with ``(column, aggregation)`` columns, like ``groupby().agg()``.
+    """
+    by, agg = _prepare(by, agg)
+    shard = partial(partial_groupby, by=by, agg=agg, query=query, chunksize=chunksize, **kwargs)
+
+    workers = min(len(paths), max_workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return combine_partials([shard(path) for path in paths], by, agg)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        partials = list(executor.map(shard, paths))
+
+    return combine_partials(partials, by, agg)
@@ -0,0 +1,99 @@
+import json
+import os
+from typing import Dict, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # sharing is optional
+    pa = None
+
+from tutorial.numerical_analysis.cache import file_fingerprint, file_key, get_cache_dir, temp_path
+from tutorial.numerical_analysis.columnar import _read_csv
+
+# Bump when the published layout changes so stale tables are ignored.
+SHARED_VERSION = 2
+# Schema metadata entry holding the memory report of the published frame.
+_REPORT_KEY = b"numerical_analysis.report"
+
+
+def shared_path(path: str, compact: bool = False, **kwargs) -> str:
+    """Location of the Arrow IPC file published for ``path`` parsed with ``kwargs``."""
+    key = file_key(file_fingerprint(path), "shared", SHARED_VERSION, compact, kwargs)
+
+    return os.path.join(get_cache_dir("shared"), f"{key}.arrow")
+
+
+def publish(path: str, compact: bool = False, **kwargs) -> str:
+    """Parse ``path`` once and write it as an uncompressed, single-batch Arrow IPC file.
+
+    A single record batch keeps every column contiguous, which is what lets
+    ``attach`` hand out numeric and string columns without copying them.
+
+    Args:
+        path: Full path of the CSV file.
+        compact: Store the frame with compact dtypes (see ``dtypes.compact_frame``).
+        **kwargs: Passed to ``pd.read_csv``.
+
+    Returns:
+        The path of the published file.
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to share frames between workers")
+
+    kwargs.setdefault("encoding", "utf-8")
+    target = shared_path(path, compact, **kwargs)
+    if os.path.exists(target):
+        return target
+
+    df = _read_csv(path, **kwargs)
+    if compact:
+        from tutorial.numerical_analysis.dtypes import compact_frame
+
+        df, report = compact_frame(df)
+    else:
+        size = int(df.memory_usage(deep=True).sum())
+        report = {"before": size, "after": size, "columns": {}}
+
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           _REPORT_KEY: json.dumps(report).encode("utf-8")})
+
+    tmp = temp_path(target)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    return target
+
+
+def attach(path: str, compact: bool = False, **kwargs) -> Tuple[pd.DataFrame, Dict]:
+    """Memory-map the table published for ``path``, publishing it first if needed.
+
+    Columns are views on the mapped file, so every process attached to the
+    same file shares one copy of it in the page cache. The frame is
+    read-only underneath; pandas' copy-on-write copies a column only when a
+    script modifies it.
+
+    Returns:
+        The frame and the memory report written by ``publish``, flagged ``shared``.
+    """
+    if int(pd.__version__.split(".")[0]) < 3:
+        # copy-on-write is what keeps scripts from writing into the read-only buffers
+        pd.set_option("mode.copy_on_write", True)
+
+    kwargs.setdefault("encoding", "utf-8")
+    target = publish(path, compact, **kwargs)
+
+    table = pa.ipc.open_file(pa.memory_map(target)).read_all()
+    df = table.to_pandas(split_blocks=True)
+
+    report = json.loads(table.schema.metadata[_REPORT_KEY])
+    report["shared"] = True
+
+    return df, report
@@ -1,9 +1,12 @@
-import io
+import asyncio
+import hashlib
 import os
-from contextlib import redirect_stdout
-from pydantic import BaseModel, Field
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pydantic import BaseModel, Field, PrivateAttr
 from textwrap import dedent
-from typing import List
+from typing import Dict, List, Literal, Optional, Tuple
 
 from langchain.tools import BaseTool, ToolRuntime
 from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
@@ -11,9 +14,54 @@ from langchain_core.runnables import Runnable
 from langchain_core.prompts.image import ImagePromptTemplate
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, PromptTemplate
 
+from tutorial.numerical_analysis.cache import LRUCache, file_fingerprint, hash_key, schema_fingerprint
+from tutorial.numerical_analysis.capture import DEFAULT_MAX_OUTPUT_CHARS, bound_text, read_artifact
+from tutorial.numerical_analysis.cubes import materialize, observed_dimensions
+from tutorial.numerical_analysis.execution import get_pool, run_scripts
+from tutorial.numerical_analysis.join_index import join_candidates, render_join_hints
+from tutorial.numerical_analysis.manifest import DirectoryChanges, refresh_directory
+from tutorial.numerical_analysis.plan import PlanExecutor, QueryPlan, has_unbounded_steps
+from tutorial.numerical_analysis.primitives import PRIMITIVES
+from tutorial.numerical_analysis.profiler import compact_profile, profile_csv, render_schema_summary
+from tutorial.numerical_analysis.sharded import expand_partitions
+
 
 class Context(BaseModel):
     directory: str
+    # one dataset split over several shards, e.g. ["*/"] for one sub-directory per city:
+    # sub-directories, CSV files or glob patterns relative to ``directory`` (see expand_partitions)
+    partitions: Optional[List[str]] = None
+
+
+def list_csv_files(directory: str) -> List[str]:
+    """Return the full paths of the CSV files in ``directory``, sorted by filename."""
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(".csv")]
+
+
+def list_context_files(context: Context) -> List[str]:
+    """Return the full paths of the CSV files the tools work on for ``context``."""
+    if not context.partitions:
+        return list_csv_files(context.directory)
+
+    return expand_partitions(context.directory, context.partitions)
+
+
+def resolve_files(context: Context, files: List[str]) -> List[str]:
+    """Turn the file names the agent passes to a tool into full paths."""
+    paths = [os.path.join(context.directory, f) for f in files]
+    if not context.partitions:
+        return paths
+
+    # schema summaries of partitioned data label files relative to the shards' common root
+    shards = list_context_files(context)
+    resolved = []
+    for file, path in zip(files, paths):
+        if not os.path.isfile(path):
+            suffix = os.sep + os.path.normpath(file)
+            path = next((shard for shard in shards if shard.endswith(suffix)), path)
+        resolved.append(path)
+
+    return resolved
 
 
 def build_standard_chat_prompt_template(kwargs):
@@ -103,6 +151,12 @@ Step 5: [整合輸出] 輸出純 Python 代碼字串，不含任何格式包裝
 """)
 
 
+# Description of SchemaTool in "compact" mode, which returns no rows
+COMPACT_SCHEMA_DESCRIPTION = dedent("""
+Reads all files in a given directory and returns one compact schema summary. Files with the same columns share a listing; each column shows its data type, null ratio, cardinality (distinct values) and up to 2 sample values, and details are dropped when the summary would exceed its token budget. Use this tool when you need to understand the structure of data files before further processing; it cannot compute statistics.
+""")
+
+
 class SchemaTool(BaseTool):
     name: str = "schema_tool"
     description: str = dedent("""
@@ -110,9 +164,33 @@ class SchemaTool(BaseTool):
     """)
 
     pipeline: Runnable
+    max_concurrency: int = 4
+    max_workers: Optional[int] = None
+    # wall-clock limit in seconds and memory growth limit in bytes for each generated script, as in PandasTool
+    timeout: Optional[float] = 120.0
+    memory_limit: Optional[int] = 4 * 1024 ** 3
+    # "llm": the model writes the profiling script; "native": profile directly with pandas;
+    # "compact": one token-budgeted summary of all files (see render_schema_summary)
+    mode: Literal["llm", "native", "compact"] = "llm"
+    max_tokens: int = 2000
+    # append the best cross-file join key candidates (see join_index.join_candidates)
+    join_hints: bool = False
+    max_join_hints: int = 5
+    # output per file above this many characters is truncated and spilled to an artifact
+    max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS
+
+    # prefetched schemas older than this many seconds are extracted again, e.g. when
+    # a run failed before after_agent could discard its prefetch
+    prefetch_max_age: float = 60.0
+
+    # schema extractions started by prefetch, by context, with their start time, until the tool picks them up
+    _prefetched: Dict[str, Tuple[float, Future]] = PrivateAttr(default_factory=dict)
+    _prefetch_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _prefetch_executor: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=2, thread_name_prefix="schema-prefetch"))
 
     @classmethod
-    def create(cls, llm: Runnable):
+    def create(cls, llm: Runnable, **kwargs):
 
         input_ = {
             "system": {"template": SCHEMA_SYSTEM_PROMPT},
@@ -125,42 +203,189 @@ class SchemaTool(BaseTool):
         }
         pipeline = build_standard_chat_prompt_template(input_) | llm | StrOutputParser()
 
-        return cls(pipeline=pipeline)
+        if kwargs.get("mode") == "compact":
+            kwargs.setdefault("description", COMPACT_SCHEMA_DESCRIPTION)
+
+        return cls(pipeline=pipeline, **kwargs)
+
+    def prefetch(self, context: Context) -> Future:
+        """Start extracting the schema for ``context`` in the background.
+
+        The next call of the tool for the same context returns this result
+        instead of extracting it again, so the work overlaps with the model
+        call that decides to use the tool (see ``SchemaPrefetchMiddleware``).
+        """
+        key = hash_key(context.model_dump())
+
+        with self._prefetch_lock:
+            self._drop_stale_prefetches()
+            _, future = self._prefetched.get(key, (None, None))
+            if future is None:
+                future = self._prefetch_executor.submit(self._schema, context)
+                self._prefetched[key] = (time.monotonic(), future)
+
+        return future
+
+    def _drop_stale_prefetches(self):
+        expired = time.monotonic() - self.prefetch_max_age
+        for key in [key for key, (started, _) in self._prefetched.items() if started < expired]:
+            self._prefetched.pop(key)[1].cancel()
+
+    def _take_prefetched(self, context: Context) -> Optional[Future]:
+        with self._prefetch_lock:
+            self._drop_stale_prefetches()
+            _, future = self._prefetched.pop(hash_key(context.model_dump()), (None, None))
+
+        return future
+
+    def discard_prefetch(self, context: Context):
+        """Drop the prefetch of ``context`` if the tool never picked it up.
+
+        Called when a run ends, so a later run, possibly after the data
+        changed, extracts a fresh schema instead of reusing this one.
+        """
+        future = self._take_prefetched(context)
+        if future is not None:
+            future.cancel()
 
     def _run(self, runtime: ToolRuntime[Context], **input):
         print(f"Running {self.name}...")
-        directory = runtime.context.directory
 
-        raw_output = ""
+        future = self._take_prefetched(runtime.context)
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as e:
+                print(f"Schema prefetch failed ({str(e)}), extracting again")
 
-        for f in os.listdir(directory):
+        return self._schema(runtime.context)
 
-            if not f.endswith(".csv"):
-                continue
+    def _schema(self, context: Context) -> str:
+        files = list_context_files(context)
+        changes = [refresh_directory(directory) for directory in self._directories(context, files)]
 
-            print(f)
+        return self._add_changes(changes, self._add_join_hints(files, self._describe(files)))
 
-            file = os.path.join(directory, f)
+    async def _arun(self, runtime: ToolRuntime[Context], **input):
+        print(f"Running {self.name}...")
 
-            code = self.pipeline.invoke({
-                "file": file
-            })
+        future = self._take_prefetched(runtime.context)
+        if future is not None:
+            try:
+                return await asyncio.wrap_future(future)
+            except Exception as e:
+                print(f"Schema prefetch failed ({str(e)}), extracting again")
+
+        files = list_context_files(runtime.context)
+        changes = await asyncio.gather(*(asyncio.to_thread(refresh_directory, directory)
+                                         for directory in self._directories(runtime.context, files)))
+
+        output = await self._adescribe(files)
+        output = await asyncio.to_thread(self._add_join_hints, files, output)
+
+        return self._add_changes(changes, output)
+
+    def _describe(self, files: List[str]) -> str:
+        if self.mode == "native":
+            return self._format(files, [self._profile(file) for file in files])
+
+        if self.mode == "compact":
+            return self._summarize(files)
+
+        codes = self.pipeline.batch([{"file": file} for file in files],
+                                    config={"max_concurrency": self.max_concurrency},
+                                    return_exceptions=True)
+
+        scripts = [code for code in codes if not isinstance(code, Exception)]
+        results = iter(run_scripts(scripts, max_workers=self.max_workers, timeout=self.timeout,
+                                   memory_limit=self.memory_limit, max_output_chars=self.max_output_chars))
+
+        outputs = [f"GENERATION ERROR: {str(code)}" if isinstance(code, Exception) else next(results)
+                   for code in codes]
+
+        return self._format(files, outputs)
+
+    async def _adescribe(self, files: List[str]) -> str:
+        if self.mode == "native":
+            outputs = await asyncio.gather(*(asyncio.to_thread(self._profile, file) for file in files))
+            return self._format(files, outputs)
+
+        if self.mode == "compact":
+            return await asyncio.to_thread(self._summarize, files)
+
+        pool = get_pool(self.max_workers)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def process(file):
+            # each file goes to the worker pool as soon as its code is ready
+            async with semaphore:
+                try:
+                    code = await self.pipeline.ainvoke({"file": file})
+                except Exception as e:
+                    return f"GENERATION ERROR: {str(e)}"
+            return await asyncio.to_thread(pool.execute, code, timeout=self.timeout, memory_limit=self.memory_limit,
+                                           max_output_chars=self.max_output_chars)
+
+        outputs = await asyncio.gather(*(process(file) for file in files))
+
+        return self._format(files, outputs)
+
+    def _profile(self, file: str) -> str:
+        try:
+            return bound_text(profile_csv(file), self.max_output_chars)
+        except Exception as e:
+            return f"EXECUTION ERROR: {str(e)}"
+
+    def _add_join_hints(self, files: List[str], output: str) -> str:
+        if not self.join_hints or len(files) < 2:
+            return output
+
+        try:
+            hints = render_join_hints(join_candidates(files, top_k=self.max_join_hints))
+        except Exception as e:
+            print(f"Join hints failed: {str(e)}")
+            return output
+
+        return f"{output}\n{hints}\n" if hints else output
+
+    @staticmethod
+    def _directories(context: Context, files: List[str]) -> List[str]:
+        if not context.partitions:
+            return [context.directory]
 
-            stdout_capture = io.StringIO()
+        return list(dict.fromkeys(os.path.dirname(file) for file in files))
+
+    @staticmethod
+    def _add_changes(changes: List[DirectoryChanges], output: str) -> str:
+        # lets the agent know earlier answers about these files may be outdated
+        notes = [note for note in (change.describe() for change in changes) if note]
+
+        return "\n".join(notes) + f"\n\n{output}" if notes else output
+
+    def _summarize(self, files: List[str]) -> str:
+        profiles = []
+        errors = ""
+
+        # shards of a partitioned dataset often share file names, so label files by their path
+        root = os.path.commonpath([os.path.dirname(file) for file in files]) if files else ""
+
+        for file in files:
             try:
-                with redirect_stdout(stdout_capture):
-                    exec(code, {"__builtins__": __builtins__})
-                output = stdout_capture.getvalue()
+                profiles.append(dict(compact_profile(file), file=os.path.relpath(file, root)))
             except Exception as e:
-                output = f"EXECUTION ERROR: {str(e)}"
+                errors += f"-{file}: EXECUTION ERROR: {str(e)}\n"
 
-            raw_output += f"-{file}: {output}\n\n"
+        return render_schema_summary(profiles, max_tokens=self.max_tokens) + "\n\n" + errors
 
-        return raw_output
+    @staticmethod
+    def _format(files: List[str], outputs: List[str]) -> str:
 
-    async def _arun(self, runtime: ToolRuntime[Context]):
+        raw_output = ""
 
-        return "Not implemented Yet"
+        for file, output in zip(files, outputs):
+            raw_output += f"-{file}: {output}\n\n"
+
+        return raw_output
 
 
 PANDAS_SYSTEM_PROMPT = dedent("""
@@ -175,12 +400,13 @@ PANDAS_SYSTEM_PROMPT = dedent("""
 - <context>: 用戶的需求
 
 # Rule
-- 使用 `pd.read_csv()` 讀取每個 CSV 檔案，指定 `encoding='utf-8'`
+- 使用 `load_csv()` 讀取每個 CSV 檔案（已預先載入的快取版 `pd.read_csv()`，參數相同，預設 `encoding='utf-8'`，無需 import）
 - 根據需求選用合適的庫進行數據處理與分析：
   - **pandas**: 資料讀取、篩選、分組、聚合、合併（`pd.merge` / `pd.concat`）、排序、描述性統計
   - **scikit-learn**: 資料預處理（標準化、編碼、降維）、模型訓練與預測、評估指標
   - **scipy**: 統計檢定（t-test、chi-square、ANOVA）、優化、信號處理、稀疏矩陣運算
 - 使用 `print()` 輸出處理結果，確保輸出清晰可讀
+- 只輸出回答需求所需的彙總結果，避免印出整張資料表（過長的輸出會被截斷）
 - 輸出的代碼必須是純 Python 代碼，不含任何 markdown 標記或解釋文字
 
 # Constraints
@@ -201,12 +427,147 @@ Step 5: [整合輸出] 輸出純 Python 代碼字串，不含任何格式包裝
 """)
 
 
+CHUNKED_PANDAS_SYSTEM_PROMPT = dedent("""
+# Role
+你是一位專業的 Python 資料科學家，擅長以分塊（out-of-core）方式處理無法一次載入記憶體的大型 CSV 檔案。
+
+# Goal
+生成一段可直接執行的 Python 代碼，在有限記憶體內對指定的大型 CSV 檔案進行數據處理與分析，並輸出處理結果。
+
+# Input
+- <files>: 待處理的 CSV 檔案完整路徑列表（檔案過大，無法整份讀入記憶體）
+- <context>: 用戶的需求
+
+# Rule
+- 嚴禁使用 `pd.read_csv()` 或 `load_csv()` 一次讀取整份檔案
+- 分組聚合優先使用已預先載入的 `chunked_groupby(path, by, agg, query=None, usecols=None)`（無需 import）：
+  - `by`: 分組欄位（字串、列表或 None）
+  - `agg`: 欄位 → 聚合方式，僅支援 `sum`、`count`、`mean`、`min`、`max`，例如 `{{"學生數": ["sum", "mean"]}}`
+  - `query`: 套用於每個分塊的 `DataFrame.query` 篩選條件，例如 `"縣市 == '臺中市'"`
+  - 回傳與 `groupby().agg()` 相同格式、欄位為 `(欄位, 聚合方式)` 的 DataFrame
+- 其他運算使用 `iter_csv_chunks(path, chunksize=500000, usecols=None)` 逐塊讀取，每塊只保留必要的彙總結果
+- 每個分塊只讀取需要的欄位（`usecols`）
+- 使用 `print()` 輸出處理結果，確保輸出清晰可讀
+- 輸出的代碼必須是純 Python 代碼，不含任何 markdown 標記或解釋文字
+
+# Constraints
+- 嚴禁輸出 markdown 代碼塊標記（如 ```python 或 ```）
+- 嚴禁在代碼前後添加任何說明、註解或對話文字
+- 僅限使用 pandas、numpy 與 Python 標準庫
+- 嚴禁修改、刪除或寫入任何檔案
+- 嚴禁使用網路請求或外部 API
+
+# Reasoning (Chain of Thought)
+請依以下步驟逐步推理，每完成一步再進行下一步：
+
+Step 1: [狀態確認] 確認輸入的 CSV 檔案列表 {files}，以及每個檔案需要的欄位
+Step 2: [需求分析] 判斷需求能否以 chunked_groupby 的分組聚合完成，否則規劃逐塊彙總的方式
+Step 3: [推理展開] 構建處理流程：篩選 → 分塊聚合 → 合併各檔案的小型結果 → 輸出
+Step 4: [驗證檢查] 確認沒有任何一步會將整份檔案載入記憶體
+Step 5: [整合輸出] 輸出純 Python 代碼字串，不含任何格式包裝
+""")
+
+
+SHARDED_PANDAS_SYSTEM_PROMPT = dedent("""
+# Role
+你是一位專業的 Python 資料科學家，擅長處理分割成多個分片（例如每個縣市一個目錄）的資料集。
+
+# Goal
+生成一段可直接執行的 Python 代碼，對分片資料集進行數據處理與分析，並輸出處理結果。
+
+# Input
+- <files>: 同一資料集各分片 CSV 檔案的完整路徑列表
+- <context>: 用戶的需求
+
+# Rule
+- 跨分片的分組聚合必須使用已預先載入的 `sharded_groupby(paths, by, agg, query=None)`（無需 import），它會在多個處理程序中平行計算各分片再合併：
+  - `paths`: 分片檔案路徑列表，通常直接傳入 {files}
+  - `by`: 分組欄位（字串、列表或 None）
+  - `agg`: 欄位 → 聚合方式，僅支援 `sum`、`count`、`mean`、`min`、`max`，例如 `{{"學生數": ["sum", "mean"]}}`
+  - `query`: 套用於每個分片的 `DataFrame.query` 篩選條件，例如 `"學年度 >= 110"`
+  - 回傳與 `groupby().agg()` 相同格式、欄位為 `(欄位, 聚合方式)` 的 DataFrame
+- 嚴禁將所有分片讀入後合併成一個 DataFrame
+- 無法以上述聚合完成的需求，才對個別分片使用 `load_csv(path)`，每個分片只保留必要的小型結果
+- 使用 `print()` 輸出處理結果，確保輸出清晰可讀
+- 輸出的代碼必須是純 Python 代碼，不含任何 markdown 標記或解釋文字
+
+# Constraints
+- 嚴禁輸出 markdown 代碼塊標記（如 ```python 或 ```）
+- 嚴禁在代碼前後添加任何說明、註解或對話文字
+- 僅限使用 pandas、numpy 與 Python 標準庫
+- 嚴禁修改、刪除或寫入任何檔案
+- 嚴禁使用網路請求或外部 API
+
+# Reasoning (Chain of Thought)
+請依以下步驟逐步推理，每完成一步再進行下一步：
+
+Step 1: [狀態確認] 確認分片檔案列表 {files}，以及需要的欄位
+Step 2: [需求分析] 將需求拆解為 sharded_groupby 可完成的篩選與分組聚合
+Step 3: [推理展開] 構建處理流程：分片平行聚合 → 對合併後的小型結果做後續計算 → 輸出
+Step 4: [驗證檢查] 確認沒有任何一步會把所有分片載入同一個 DataFrame
+Step 5: [整合輸出] 輸出純 Python 代碼字串，不含任何格式包裝
+""")
+
+
+CUBE_SYSTEM_PROMPT = dedent("""
+# Pre-aggregates
+- 常用維度（例如縣市、學年度、學校類別）已預先彙總成小型資料表
+- 分組聚合優先使用已預先載入的 `cube_groupby(paths, by, agg, query=None)`（無需 import），可直接由預先彙總的資料表回答，無須掃描整份檔案：
+  - `paths`: 一個或多個 CSV 檔案路徑（例如每年一個檔案），結果會跨檔案合併
+  - `by`: 分組欄位（字串、列表或 None）
+  - `agg`: 欄位 → 聚合方式，僅支援 `sum`、`count`、`mean`、`min`、`max`，例如 `{{"學生數": ["sum", "mean"]}}`
+  - `query`: `DataFrame.query` 篩選條件，只篩選分組維度時最快，例如 `"縣市 == '臺中市'"`
+  - 回傳與 `groupby().agg()` 相同格式、欄位為 `(欄位, 聚合方式)` 的 DataFrame
+- 其他需求才使用 `load_csv()` 讀取完整資料
+""")
+
+
+PLAN_SYSTEM_PROMPT = dedent("""
+# Role
+你是一位專業的數據分析師，擅長將分析需求拆解為結構化的查詢計畫（query plan）。
+
+# Goal
+根據使用者需求，輸出一份 JSON 查詢計畫，由內建的向量化執行器直接在資料表上執行，不需撰寫任何 Python 代碼。
+
+# Input
+- <files>: 可用的 CSV 檔案名稱列表
+- <context>: 用戶的需求
+
+# Rule
+- `source` 為計畫起始的 CSV 檔案名稱（必須來自 <files>）
+- `steps` 依序套用，可用的操作：
+  - `filter`: 以 AND 組合的條件篩選列
+  - `select`: 保留指定欄位
+  - `groupby`: 分組並聚合，輸出欄位命名為 `<欄位>_<聚合方式>`
+  - `agg`: 對整張表聚合，輸出單列
+  - `join`: 與另一份查詢計畫（`right`）以 `on` 欄位合併
+  - `sort`: 排序
+  - `pivot`: 樞紐分析
+  - `head`: 取前 n 列
+- 後續步驟引用的欄位名稱必須是前一步驟的輸出欄位
+
+# Constraints
+- 僅輸出符合格式的 JSON，嚴禁輸出任何說明文字
+- 若需求無法以上述操作表達，仍輸出最接近的計畫，系統會自動改用代碼執行
+
+# Output Format
+{format_instructions}
+""")
+
+
 class FilesInputs(BaseModel):
     files: List[str] = Field(
         description="List of CSV file names to process. Provide the filenames (without directory path) of the data files you want to analyze or transform.")
     context: str = Field(description="Summary of the schema of the files")
 
 
+PLAN_SCRIPT = dedent("""
+from tutorial.numerical_analysis.plan import QueryPlan, worker_executor
+
+print(worker_executor({columnar!r}).execute(QueryPlan.model_validate_json({plan!r}), {directory!r}).to_string())
+""").strip()
+
+
 class PandasTool(BaseTool):
     name: str = "pandas_tool"
 
@@ -222,23 +583,82 @@ Processes specified CSV files using Python and pandas. Provide a list of file na
     description: str = description_template.format(input_format_instructions=input_format_instructions)
 
     pipeline: Runnable
+    max_workers: Optional[int] = None
+    # wall-clock limit in seconds and memory growth limit in bytes for each execution
+    timeout: Optional[float] = 120.0
+    memory_limit: Optional[int] = 4 * 1024 ** 3
+    # serve pd.read_csv from memory-mapped Feather copies of unchanged files (needs pyarrow)
+    columnar_cache: bool = False
+    # cache load_csv frames with category strings (see dtypes.compact_frame)
+    compact_dtypes: bool = False
+    # memory-map frames from Arrow files published once for all workers and agent processes (needs pyarrow)
+    shared_frames: bool = False
+    # files above this size (bytes) are analysed chunk by chunk with chunked_pipeline
+    chunk_threshold: Optional[int] = 1024 ** 3
+    chunked_pipeline: Optional[Runnable] = None
+    # questions over several shards of a partitioned Context use sharded_pipeline
+    sharded_pipeline: Optional[Runnable] = None
+    # generated code keyed by (files, context, schema); output keyed by (code, file fingerprints)
+    code_cache: Optional[LRUCache] = None
+    result_cache: Optional[LRUCache] = None
+    # "code": the model writes pandas code; "plan": the model writes a QueryPlan run without exec,
+    # falling back to code when the plan cannot be parsed or executed
+    mode: Literal["code", "plan"] = "code"
+    plan_pipeline: Optional[Runnable] = None
+    plan_executor: PlanExecutor = Field(default_factory=lambda data: PlanExecutor(columnar=data["columnar_cache"]))
+    # plans that join or pivot run in the worker pool under timeout and memory_limit, like code
+    isolate_unbounded_plans: bool = True
+    # output above this many characters is truncated and spilled to an artifact
+    max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS
+    # pre-aggregate the files over these dimension sets (plus frequently grouped ones) and let
+    # generated code answer group-bys from them through cube_groupby
+    cubes: bool = False
+    cube_dimensions: List[List[str]] = Field(default_factory=list)
 
     @classmethod
-    def create(cls, llm: Runnable):
-
-        input_ = {
-            "system": {"template": PANDAS_SYSTEM_PROMPT},
-            "human": {
-                "template": dedent("""
-                    <files>: {files},
-                    <context>: {context}
-                """),
-                "input_variable": ["files", "context"]
-            }
+    def create(cls, llm: Runnable, **kwargs):
+
+        human = {
+            "template": dedent("""
+                <files>: {files},
+                <context>: {context}
+            """),
+            "input_variable": ["files", "context"]
         }
-        pipeline = build_standard_chat_prompt_template(input_) | llm | StrOutputParser()
 
-        return cls(pipeline=pipeline)
+        system = [{"template": PANDAS_SYSTEM_PROMPT}]
+        if kwargs.get("cubes"):
+            system.append({"template": CUBE_SYSTEM_PROMPT})
+
+        pipeline = build_standard_chat_prompt_template(
+            {"system": system, "human": human}) | llm | StrOutputParser()
+        chunked_pipeline = build_standard_chat_prompt_template(
+            {"system": {"template": CHUNKED_PANDAS_SYSTEM_PROMPT}, "human": human}) | llm | StrOutputParser()
+        sharded_pipeline = build_standard_chat_prompt_template(
+            {"system": {"template": SHARDED_PANDAS_SYSTEM_PROMPT}, "human": human}) | llm | StrOutputParser()
+
+        plan_parser = PydanticOutputParser(pydantic_object=QueryPlan)
+        plan_pipeline = build_standard_chat_prompt_template({
+            "system": {"template": PLAN_SYSTEM_PROMPT,
+                       "partial_variables": {"format_instructions": plan_parser.get_format_instructions()}},
+            "human": human}) | llm | plan_parser
+
+        return cls(pipeline=pipeline, chunked_pipeline=chunked_pipeline, sharded_pipeline=sharded_pipeline,
+                   plan_pipeline=plan_pipeline, **kwargs)
+
+    def _select_pipeline(self, paths: List[str], partitioned: bool = False) -> Runnable:
+        if partitioned and len(paths) > 1 and self.sharded_pipeline is not None:
+            print("Partitioned input detected, switching to sharded execution")
+            return self.sharded_pipeline
+
+        if self.chunked_pipeline is None or self.chunk_threshold is None:
+            return self.pipeline
+
+        if any(os.path.getsize(path) > self.chunk_threshold for path in paths if os.path.isfile(path)):
+            print("Large input detected, switching to chunked execution")
+            return self.chunked_pipeline
+
+        return self.pipeline
 
     def _run(self, runtime: ToolRuntime[Context], **input):
         print(f"Running {self.name}...")
@@ -253,26 +673,223 @@ Processes specified CSV files using Python and pandas. Provide a list of file na
         print(context)
         print("=" * 20)
 
-        code = self.pipeline.invoke({
-            "files": [os.path.join(directory, f) for f in files],
-            "context": context
-        })
+        paths = resolve_files(runtime.context, files)
+        pipeline = self._select_pipeline(paths, partitioned=bool(runtime.context.partitions))
 
+        if self.mode == "plan" and pipeline is self.pipeline and self.plan_pipeline is not None:
+            try:
+                return self._run_plan(files, paths, context, directory)
+            except Exception as e:
+                print(f"Query plan failed ({str(e)}), falling back to code generation")
+
+        return self._run_code(pipeline, paths, context)
+
+    def _code_key(self, kind: str, paths: List[str], context: str) -> Optional[str]:
+        if self.code_cache is None or not all(os.path.isfile(path) for path in paths):
+            return None
+
+        normalized = sorted({os.path.normpath(os.path.abspath(path)) for path in paths})
+
+        return hash_key(kind, normalized, " ".join(context.split()),
+                        [schema_fingerprint(path) for path in normalized])
+
+    def _run_plan(self, files: List[str], paths: List[str], context: str, directory: str) -> str:
+        plan_key = self._code_key("plan", paths, context)
+        cached = self.code_cache.get(plan_key) if plan_key is not None else None
+
+        if cached is not None:
+            plan = QueryPlan.model_validate(cached)
+        else:
+            plan = self.plan_pipeline.invoke({
+                "files": files,
+                "context": context
+            })
+
+        print("=" * 20)
+        print("plan:" if cached is None else "plan (cached):")
+        print(plan.model_dump_json(indent=2))
         print("=" * 20)
-        print("code:")
+
+        if self.isolate_unbounded_plans and has_unbounded_steps(plan):
+            output = get_pool(self.max_workers).execute(
+                PLAN_SCRIPT.format(columnar=self.columnar_cache, plan=plan.model_dump_json(), directory=directory),
+                timeout=self.timeout, memory_limit=self.memory_limit, max_output_chars=self.max_output_chars)
+            if output.startswith("EXECUTION ERROR"):
+                raise RuntimeError(output)
+        else:
+            output = bound_text(self.plan_executor.execute(plan, directory).to_string() + "\n",
+                                self.max_output_chars)
+
+        if plan_key is not None and cached is None:
+            self.code_cache.set(plan_key, plan.model_dump())
+
+        return output
+
+    def _run_code(self, pipeline: Runnable, paths: List[str], context: str) -> str:
+        cacheable = all(os.path.isfile(path) for path in paths)
+
+        kind = ("chunked" if pipeline is self.chunked_pipeline else
+                "sharded" if pipeline is self.sharded_pipeline else "code")
+        code_key = self._code_key(kind, paths, context)
+        code = self.code_cache.get(code_key) if code_key is not None else None
+
+        generated = code is None
+        if generated:
+            code = pipeline.invoke({
+                "files": paths,
+                "context": context
+            })
+
+        print("=" * 20)
+        print("code:" if generated else "code (cached):")
         print(code)
         print("=" * 20)
 
-        stdout_capture = io.StringIO()
+        result_key = None
+        output = None
+        if self.result_cache is not None and cacheable:
+            result_key = hash_key("result", hashlib.sha1(code.encode("utf-8")).hexdigest(),
+                                  [file_fingerprint(path) for path in paths])
+            output = self.result_cache.get(result_key)
+
+        executed = output is None
+        if executed:
+            if self.cubes and pipeline is self.pipeline and cacheable:
+                self._materialize(paths)
+            output = get_pool(self.max_workers).execute(code, timeout=self.timeout,
+                                                        memory_limit=self.memory_limit,
+                                                        columnar=self.columnar_cache,
+                                                        compact_dtypes=self.compact_dtypes,
+                                                        shared_frames=self.shared_frames,
+                                                        max_output_chars=self.max_output_chars)
+
+        # failures are never cached, so a retry regenerates and re-executes
+        if not output.startswith("EXECUTION ERROR"):
+            if result_key is not None and executed:
+                self.result_cache.set(result_key, output)
+            if code_key is not None and generated:
+                self.code_cache.set(code_key, code)
+
+        return output
+
+    def _materialize(self, paths: List[str]):
+        dimensions = list({tuple(dims): dims for dims in self.cube_dimensions + observed_dimensions()}.values())
+
         try:
-            with redirect_stdout(stdout_capture):
-                exec(code, {"__builtins__": __builtins__})
-            output = stdout_capture.getvalue()
+            materialize(paths, dimensions)
         except Exception as e:
-            output = f"EXECUTION ERROR: {str(e)}"
+            # cube_groupby falls back to scanning the files
+            print(f"Building pre-aggregates failed: {str(e)}")
+
+    async def _arun(self, runtime: ToolRuntime[Context]):
+
+        return "Not implemented Yet"
+
+
+PRIMITIVE_SCRIPT = dedent("""
+import pandas as pd
+from tutorial.numerical_analysis.primitives import {function}
+
+frames = [load_csv(path) for path in {paths!r}]
+df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+print({function}(df, **{params!r}).to_string())
+""").strip()
+
+
+class PrimitiveTool(BaseTool):
+    """Runs one prebuilt analysis primitive (see ``primitives.PRIMITIVES``) without generating code.
+
+    The call is turned into a fixed script and executed in the worker pool, so
+    it reuses the workers' cached frames and the same time and memory limits
+    as ``PandasTool``.
+    """
+    primitive: str
+    max_workers: Optional[int] = None
+    timeout: Optional[float] = 120.0
+    memory_limit: Optional[int] = 4 * 1024 ** 3
+    compact_dtypes: bool = False
+    shared_frames: bool = False
+    # output keyed by (primitive, arguments, file fingerprints)
+    result_cache: Optional[LRUCache] = None
+    max_output_chars: Optional[int] = DEFAULT_MAX_OUTPUT_CHARS
+
+    @classmethod
+    def create(cls, primitive: str, **kwargs):
+        spec = PRIMITIVES[primitive]
+        input_format_instructions = PydanticOutputParser(pydantic_object=spec.inputs).get_format_instructions()
+
+        return cls(name=primitive, description=f"{spec.description}\n\n{input_format_instructions}",
+                   primitive=primitive, **kwargs)
+
+    def _run(self, runtime: ToolRuntime[Context], **input):
+        print(f"Running {self.name}...")
+        spec = PRIMITIVES[self.primitive]
+
+        args = spec.inputs.model_validate(input.get("input", input))
+        paths = resolve_files(runtime.context, args.files)
+        params = args.model_dump(exclude={"files"})
+
+        code = PRIMITIVE_SCRIPT.format(function=spec.function.__name__, paths=paths, params=params)
+
+        result_key = None
+        if self.result_cache is not None and all(os.path.isfile(path) for path in paths):
+            result_key = hash_key("primitive", self.primitive, params, [file_fingerprint(path) for path in paths])
+            output = self.result_cache.get(result_key)
+            if output is not None:
+                return output
+
+        output = get_pool(self.max_workers).execute(code, timeout=self.timeout, memory_limit=self.memory_limit,
+                                                    max_output_chars=self.max_output_chars,
+                                                    compact_dtypes=self.compact_dtypes,
+                                                    shared_frames=self.shared_frames)
+
+        if result_key is not None and not output.startswith("EXECUTION ERROR"):
+            self.result_cache.set(result_key, output)
 
         return output
 
-    async def _arun(self, runtime: ToolRuntime[Context]):
 
-        return "Not implemented Yet"
\ No newline at end of file
+class ArtifactInputs(BaseModel):
+    artifact_id: str = Field(description="The artifact id given in a truncated tool output")
+    start_line: int = Field(default=0, ge=0, description="First line to read, counting from 0")
+    max_lines: int = Field(default=100, ge=1, description="Number of lines to read")
+
+
+class ArtifactTool(BaseTool):
+    """Reads a line range of the full output of a truncated tool call (see ``capture.BoundedCapture``).
+
+    The range is capped at ``max_lines`` lines and ``max_chars`` characters,
+    so paging through an artifact never floods the context it was cut to spare.
+    """
+    name: str = "artifact_tool"
+    description: str = dedent("""
+Reads part of the full output of a tool call whose output was truncated ("full output saved as artifact <id>"). Provide the artifact id and a line range; read the omitted lines a page at a time instead of running the analysis again.
+
+{input_format_instructions}
+    """).format(input_format_instructions=PydanticOutputParser(pydantic_object=ArtifactInputs).get_format_instructions())
+
+    max_lines: int = 200
+    max_chars: int = DEFAULT_MAX_OUTPUT_CHARS
+
+    def _run(self, runtime: ToolRuntime[Context], **input):
+        print(f"Running {self.name}...")
+
+        args = ArtifactInputs.model_validate(input.get("input", input))
+        try:
+            text = read_artifact(args.artifact_id, args.start_line, min(args.max_lines, self.max_lines),
+                                 self.max_chars)
+        except FileNotFoundError:
+            return f"ERROR: artifact {args.artifact_id} does not exist (it may have been pruned)"
+
+        if not text:
+            return f"Artifact {args.artifact_id} has no lines from line {args.start_line} on"
+
+        end = args.start_line + len(text.splitlines())
+
+        return f"{text.rstrip()}\n[lines {args.start_line}-{end - 1}; continue with start_line={end}]"
+
+
+def build_primitive_tools(**kwargs) -> List[PrimitiveTool]:
+    """One ``PrimitiveTool`` per registered primitive, all configured with ``kwargs``."""
+    return [PrimitiveTool.create(primitive, **kwargs) for primitive in PRIMITIVES]
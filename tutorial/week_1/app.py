@@ -1,76 +1,78 @@
+import hashlib
 import os
-import re
-from typing import List
+from typing import Dict, Iterator, List
 
-import pandas as pd
-from langchain_community.retrievers import BM25Retriever
 from langchain.docstore.document import Document
 from transformers import AutoTokenizer
 
+from tutorial.week_1.bm25 import SparseBM25Retriever, cached_index
+from tutorial.week_1.hybrid import HybridRetriever
+from tutorial.week_1.tokenization import tokenize_batch, tokenize_corpus
+
 # Load the pre-trained BPE tokenizer
 tokenizer = AutoTokenizer.from_pretrained("p208p2002/llama-traditional-chinese-120M")
 
 
 def _preprocess_func(text: str):
-    # 1. Define special tokens to remove
-    special_tokens = {"<s>", "</s>", "[PAD]", "[UNK]"}
-
-    encoded = tokenizer(text)
+    # Tokenize, drop special tokens and punctuation (keep only Chinese/English/number words)
+    return tokenize_batch(tokenizer, [text])[0]
 
-    tokens = tokenizer.convert_ids_to_tokens(encoded["input_ids"])
 
-    # 2. Remove special tokens
-    tokens = [t.replace("▁", "") for t in tokens if t not in special_tokens]
+FIELDS = ("詩名", "作者", "詩體", "詩文")
 
-    # 3. Remove punctuation (keep only Chinese/English/number words)
-    tokens = [t for t in tokens if re.match(r'[\w一-龥]+', t)]
 
-    # Stringify the tokens
-    return [str(token) for token in tokens]
+def iter_poems(filename: str = "唐詩三百首.txt") -> Iterator[Dict[str, str]]:
+    """Yield the poems of ``filename`` one at a time, reading it line by line.
 
+    Poems are blocks of ``欄位:內容`` lines separated by blank lines.
+    """
+    entry = {}
 
-# Read file
-def load_poem():
-    filename = "唐詩三百首.txt"
     with open(filename, "r", encoding="utf-8") as f:
-        text = f.read()
+        for line in f:
+            line = line.strip()
 
-    poems = []
+            # A blank line closes the current poem
+            if not line:
+                if entry:
+                    yield entry
+                entry = {}
+                continue
 
-    # Split by blank lines
-    blocks = [b.strip() for b in text.strip().split("\n\n") if b.strip()]
+            field, separator, value = line.partition(":")
+            if separator and field in FIELDS:
+                entry[field] = value.strip()
 
-    for block in blocks:
-        entry = {}
-        for line in block.split("\n"):
-            if line.startswith("詩名:"):
-                entry["詩名"] = line.replace("詩名:", "").strip()
-            elif line.startswith("作者:"):
-                entry["作者"] = line.replace("作者:", "").strip()
-            elif line.startswith("詩體:"):
-                entry["詩體"] = line.replace("詩體:", "").strip()
-            elif line.startswith("詩文:"):
-                entry["詩文"] = line.replace("詩文:", "").strip()
-        if len(entry) != 0:
-            poems.append(entry)
+    if entry:
+        yield entry
 
-    return poems
 
+def poem_id(poem: Dict[str, str]) -> str:
+    """Stable id of a poem, from its title, author and text, so it can be deleted from the retriever."""
+    key = "\t".join(poem.get(field) or "" for field in ("詩名", "作者", "詩文"))
 
-def build_documents(poems: List) -> List:
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _to_document(poem: Dict[str, str]) -> Document:
+    return Document(id=poem_id(poem), page_content=poem.get("詩文", ""),
+                    metadata={"詩名": poem.get("詩名"),
+                              "作者": poem.get("作者"),
+                              "詩體": poem.get("詩體")})
+
+
+def iter_documents(filename: str = "唐詩三百首.txt") -> Iterator[Document]:
+    """Yield a Document per poem of ``filename`` without holding the corpus in memory."""
+    return map(_to_document, iter_poems(filename))
 
-    df_poem = pd.DataFrame(poems)
 
-    documents = []
+# Read file
+def load_poem():
+    return list(iter_poems())
 
-    for _, row in df_poem.iterrows():
-        document = Document(page_content=row['詩文'],
-                            metadata={"詩名": row["詩名"],
-                                      "作者": row["作者"],
-                                      "詩體": row["詩體"]})
-        documents.append(document)
 
-    return documents
+def build_documents(poems: List) -> List:
+    return [_to_document(poem) for poem in poems]
 
 
 def build_retriever(k: int):
@@ -78,7 +80,27 @@ def build_retriever(k: int):
     poems = load_poem()
     documents = build_documents(poems)
 
-    bm25_poem_retriever = BM25Retriever.from_documents(documents, k=k,
-                                                       bm25_params={"k1": 2.5},
-                                                       preprocess_func=_preprocess_func
-                                                       )
\ No newline at end of file
+    # The index is built once per corpus and tokenizer, then memory-mapped by every process
+    index = cached_index([document.page_content for document in documents],
+                         tokenize=lambda texts: tokenize_corpus(tokenizer, texts),
+                         tokenizer_name=tokenizer.name_or_path, k1=2.5)
+
+    # Same results as BM25Retriever.from_documents, scored with sparse matrix products
+    bm25_poem_retriever = SparseBM25Retriever(index=index, docs=documents, k=k,
+                                              preprocess_func=_preprocess_func
+                                              )
+
+    return bm25_poem_retriever
+
+
+def build_streaming_retriever(k: int, filename: str = "唐詩三百首.txt", chunk_size: int = 10_000):
+    """Index ``filename`` ``chunk_size`` poems at a time, for corpora too large to tokenize in one go."""
+    return SparseBM25Retriever.from_document_stream(iter_documents(filename), chunk_size=chunk_size,
+                                                    tokenize=lambda texts: tokenize_batch(tokenizer, texts),
+                                                    k=k, bm25_params={"k1": 2.5},
+                                                    preprocess_func=_preprocess_func)
+
+
+def build_hybrid_retriever(k: int, embeddings, fetch_k: int = 20):
+    """BM25 and embedding retrieval over the poems, run concurrently and fused by reciprocal rank."""
+    return HybridRetriever.from_sparse(build_retriever(fetch_k), embeddings, k=k, fetch_k=fetch_k)
@@ -0,0 +1,179 @@
+"""Offline latency benchmarks for the week_1 poem retrievers.
+
+Usage:
+    python -m tutorial.week_1.benchmark bm25 --docs 300 10000 100000 --queries 100
+    python -m tutorial.week_1.benchmark hybrid --docs 300 10000 --queries 100 --latency 0.02
+
+``bm25`` compares rank_bm25, as used by ``BM25Retriever``, against
+``bm25.BM25Index``. ``hybrid`` compares ``hybrid.HybridRetriever`` against
+an ``EnsembleRetriever`` over the same BM25 and embedding legs; embeddings
+are deterministic fakes that sleep ``--latency`` seconds per call, standing
+in for an embedding model.
+
+The corpus is synthetic: documents of Zipf-distributed characters, about
+the length of a Tang poem, so no tokenizer download is needed.
+"""
+import argparse
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from rank_bm25 import BM25Okapi
+
+from tutorial.week_1.bm25 import BM25Index, SparseBM25Retriever
+from tutorial.week_1.hybrid import RRF_C, DenseRetriever, HybridRetriever
+
+BM25_PARAMS = {"k1": 2.5}
+# Common Chinese characters, used as the synthetic vocabulary
+VOCABULARY = [chr(code) for code in range(0x4E00, 0x4E00 + 5000)]
+
+
+def make_corpus(docs: int, mean_length: int = 40, seed: int = 0) -> List[List[str]]:
+    rng = np.random.default_rng(seed)
+    lengths = rng.poisson(mean_length, docs) + 1
+    tokens = (rng.zipf(1.3, lengths.sum()) - 1) % len(VOCABULARY)
+
+    return [[VOCABULARY[t] for t in chunk] for chunk in np.split(tokens, np.cumsum(lengths)[:-1])]
+
+
+def make_queries(corpus: List[List[str]], queries: int, length: int = 5, seed: int = 1) -> List[List[str]]:
+    rng = np.random.default_rng(seed)
+
+    return [list(rng.choice(corpus[i], min(length, len(corpus[i])))) for i in rng.integers(0, len(corpus), queries)]
+
+
+def _rank_bm25_top_k(bm25: BM25Okapi, query: List[str], k: int) -> np.ndarray:
+    # what BM25Retriever.get_relevant_documents does per query
+    return np.argsort(bm25.get_scores(query))[::-1][:k]
+
+
+def benchmark(docs: int, queries: int, k: int = 4) -> dict:
+    corpus = make_corpus(docs)
+    batch = make_queries(corpus, queries)
+
+    start = time.perf_counter()
+    bm25 = BM25Okapi(corpus, **BM25_PARAMS)
+    rank_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = BM25Index.from_tokens(corpus, **BM25_PARAMS)
+    sparse_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for query in batch:
+        _rank_bm25_top_k(bm25, query, k)
+    rank_query = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    for query in batch:
+        index.top_k([query], k)
+    sparse_query = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    index.top_k(batch, k)
+    sparse_batch = (time.perf_counter() - start) / queries
+
+    max_diff = max(float(np.abs(bm25.get_scores(query) - index.get_scores(query)).max()) for query in batch[:10])
+
+    return {"docs": docs, "rank_bm25_build_s": rank_build, "sparse_build_s": sparse_build,
+            "rank_bm25_query_ms": rank_query * 1000, "sparse_query_ms": sparse_query * 1000,
+            "sparse_batch_query_ms": sparse_batch * 1000, "max_score_diff": max_diff}
+
+
+class LatencyEmbedding(DeterministicFakeEmbedding):
+    """Fake embeddings that take ``latency`` seconds per call, like a remote or on-device model."""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+def _ensemble(retrievers, weights, fetch_k: int):
+    try:
+        from langchain_classic.retrievers import EnsembleRetriever
+    except ImportError:
+        EnsembleRetriever = None
+
+    if EnsembleRetriever is not None:
+        ensemble = EnsembleRetriever(retrievers=retrievers, weights=weights, c=RRF_C)
+        return ensemble.invoke
+
+    def invoke(query: str) -> List[Document]:
+        # what EnsembleRetriever does: each retriever in turn, then weighted reciprocal rank in Python
+        scores, docs = {}, {}
+        for retriever, weight in zip(retrievers, weights):
+            for rank, doc in enumerate(retriever.invoke(query), start=1):
+                scores[doc.page_content] = scores.get(doc.page_content, 0.0) + weight / (rank + RRF_C)
+                docs.setdefault(doc.page_content, doc)
+        return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+    return invoke
+
+
+def benchmark_hybrid(docs: int, queries: int, k: int = 4, fetch_k: int = 20, latency: float = 0.02) -> dict:
+    corpus = make_corpus(docs)
+    documents = [Document(page_content="".join(tokens), metadata={"i": i}) for i, tokens in enumerate(corpus)]
+    batch = ["".join(query) for query in make_queries(corpus, queries)]
+
+    sparse = SparseBM25Retriever.from_documents(documents, k=fetch_k, bm25_params=BM25_PARAMS, preprocess_func=list,
+                                                tokenized=corpus)
+    dense = DenseRetriever.from_documents(documents, DeterministicFakeEmbedding(size=384), k=fetch_k)
+    dense.embeddings = LatencyEmbedding(size=384, latency=latency)
+
+    hybrid = HybridRetriever(sparse=sparse, dense=dense, k=k, fetch_k=fetch_k)
+    ensemble = _ensemble([sparse, dense], [0.5, 0.5], fetch_k)
+
+    start = time.perf_counter()
+    expected = [ensemble(query)[:k] for query in batch]
+    ensemble_query = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    results = [hybrid.invoke(query) for query in batch]
+    hybrid_query = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    hybrid.search_batch(batch)
+    hybrid_batch = (time.perf_counter() - start) / queries
+
+    same = np.mean([[d.metadata["i"] for d in a] == [d.metadata["i"] for d in b] for a, b in zip(results, expected)])
+
+    return {"docs": docs, "ensemble_query_ms": ensemble_query * 1000, "hybrid_query_ms": hybrid_query * 1000,
+            "hybrid_batch_query_ms": hybrid_batch * 1000, "same_ranking": float(same)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", nargs="?", choices=["bm25", "hybrid"], default="bm25")
+    parser.add_argument("--docs", type=int, nargs="+", default=[300, 10_000, 100_000], help="corpus sizes")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per fake embedding call (hybrid)")
+    args = parser.parse_args()
+
+    if args.benchmark == "hybrid":
+        print(f"{'docs':>8} {'query ensemble':>15} {'query hybrid':>13} {'batched hybrid':>15} {'same ranking':>13}")
+        for docs in args.docs:
+            r = benchmark_hybrid(docs, args.queries, args.k, latency=args.latency)
+            print(f"{r['docs']:>8} {r['ensemble_query_ms']:>13.2f}ms {r['hybrid_query_ms']:>11.2f}ms "
+                  f"{r['hybrid_batch_query_ms']:>13.3f}ms {r['same_ranking']:>13.0%}")
+        return
+
+    print(f"{'docs':>8} {'build rank_bm25':>16} {'build sparse':>13} {'query rank_bm25':>16} "
+          f"{'query sparse':>13} {'batched sparse':>15} {'max diff':>9}")
+    for docs in args.docs:
+        r = benchmark(docs, args.queries, args.k)
+        print(f"{r['docs']:>8} {r['rank_bm25_build_s']:>15.3f}s {r['sparse_build_s']:>12.3f}s "
+              f"{r['rank_bm25_query_ms']:>14.2f}ms {r['sparse_query_ms']:>11.3f}ms "
+              f"{r['sparse_batch_query_ms']:>13.3f}ms {r['max_score_diff']:>9.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, PrivateAttr
+from scipy import sparse
+
+from tutorial.week_1.tokenization import TOKENIZATION_VERSION, corpus_hash, get_cache_dir
+
+# Bump when the saved layout changes so stale indexes are rebuilt
+INDEX_VERSION = 2
+# Arrays saved by BM25Index.save, one .npy file each
+_ARRAYS = ("postings_data", "postings_indices", "postings_indptr", "weights_data", "tf_data", "tf_indices",
+           "tf_indptr", "doc_len", "doc_freq", "idf", "sorted_terms", "sorted_term_ids")
+
+
+def default_preprocessing_func(text: str) -> List[str]:
+    return text.split()
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and values of the ``k`` largest entries of every row, largest first."""
+    k = max(min(k, scores.shape[1]), 0)
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0))
+
+    # partial sort: only the top k of each row get ordered
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+
+    return top, np.take_along_axis(scores, top, axis=1)
+
+
+class BM25Index:
+    """BM25 scores from a sparse term-document matrix, as ``rank_bm25.BM25Okapi`` computes them.
+
+    The per-document part of the formula, ``idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))``,
+    is precomputed for every term occurrence, so scoring a query is one sparse
+    product of its term counts with the weight matrix instead of a Python loop
+    over the documents.
+
+    An index can be saved to a directory of ``.npy`` files and loaded back
+    memory-mapped (see ``save`` and ``load``), so every process serving the
+    same index shares one copy of it in the page cache.
+
+    Documents can be added and removed without a rebuild (see ``add`` and
+    ``delete``). Added documents go to small segments and removed ones are
+    only flagged, while document frequencies, the document count and the
+    total length are updated from the changed documents alone. Scores stay
+    equal to those of an index rebuilt from the remaining documents: until
+    ``compact`` merges everything back, the weights of the query terms are
+    computed at query time from the current idf and average length.
+
+    Args:
+        vocabulary: Term -> row of ``postings``.
+        postings: Terms x documents matrix of term frequencies.
+        k1: Term frequency saturation.
+        b: Document length normalization.
+        epsilon: Floor of the idf, as a share of the average idf, for terms in
+            more than half of the documents.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], postings: sparse.csr_matrix,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.vocabulary = vocabulary
+        self.postings = sparse.csr_matrix(postings, dtype=np.float64)
+        self.postings.sum_duplicates()
+        # documents x terms, to find the terms of a deleted document
+        self.tf = self.postings.T.tocsr()
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        self.doc_len = np.asarray(self.tf.sum(axis=1)).ravel()
+        self.doc_freq = np.diff(self.postings.indptr)
+        self._reset()
+        self.weights = self._weights()
+
+    def _reset(self):
+        n = self.postings.shape[1]
+        self.deleted = np.zeros(n, dtype=bool)
+        self.corpus_size = n
+        self.total_len = float(self.doc_len.sum())
+        # (first document, documents x terms) of every added batch; the postings of its
+        # documents are sliced out of it per query instead of being stored twice
+        self._segments: List[Tuple[int, sparse.csr_matrix]] = []
+        self._idf = None
+
+    def save(self, directory: str) -> str:
+        """Write the index to ``directory``, replacing nothing that already exists there.
+
+        Several processes may save to the same ``directory`` at once; the
+        first rename wins and the others keep its copy.
+
+        Returns:
+            ``directory``.
+        """
+        if self.weights is None:
+            raise ValueError("compact() the index before saving it: documents were added or deleted")
+
+        terms = np.array(sorted(self._vocabulary()), dtype=str)
+        arrays = {"postings_data": self.postings.data, "postings_indices": self.postings.indices,
+                  "postings_indptr": self.postings.indptr, "weights_data": self.weights.data,
+                  "tf_data": self.tf.data, "tf_indices": self.tf.indices, "tf_indptr": self.tf.indptr,
+                  "doc_len": self.doc_len, "doc_freq": self.doc_freq, "idf": self.idf,
+                  # terms are looked up by binary search, so no dictionary is rebuilt on load
+                  "sorted_terms": terms,
+                  "sorted_term_ids": np.array([self.vocabulary[term] for term in terms], dtype=np.int64)}
+
+        # write-then-rename so concurrent readers never see a partial index
+        directory = directory.rstrip(os.sep)
+        parent, name = os.path.split(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        # unique per writer, threads included
+        tmp = tempfile.mkdtemp(prefix=f"{name}.", suffix=".tmp", dir=parent)
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), arrays[name])
+            with open(os.path.join(tmp, "params.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "k1": self.k1, "b": self.b, "epsilon": self.epsilon,
+                           "shape": list(self.postings.shape)}, f)
+            try:
+                os.replace(tmp, directory)
+            except OSError:
+                # another process saved the same index first: keep its copy
+                if not os.path.isdir(directory):
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        return directory
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "BM25Index":
+        """Load an index written by ``save``, memory-mapped unless ``mmap`` is ``False``.
+
+        Nothing is recomputed: loading maps the arrays and reads ``params.json``.
+        """
+        with open(os.path.join(directory, "params.json"), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        if params["version"] != INDEX_VERSION:
+            raise ValueError(f"{directory} holds a version {params['version']} index, expected {INDEX_VERSION}")
+
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in _ARRAYS}
+        terms, docs = params["shape"]
+
+        index = cls.__new__(cls)
+        index.k1, index.b, index.epsilon = params["k1"], params["b"], params["epsilon"]
+        index.vocabulary = None
+        index.sorted_terms, index.sorted_term_ids = arrays["sorted_terms"], arrays["sorted_term_ids"]
+        structure = (arrays["postings_indices"], arrays["postings_indptr"])
+        index.postings = sparse.csr_matrix((arrays["postings_data"], *structure), shape=(terms, docs), copy=False)
+        index.weights = sparse.csr_matrix((arrays["weights_data"], *structure), shape=(terms, docs), copy=False)
+        index.tf = sparse.csr_matrix((arrays["tf_data"], arrays["tf_indices"], arrays["tf_indptr"]),
+                                     shape=(docs, terms), copy=False)
+        index.doc_len, index.doc_freq = arrays["doc_len"], arrays["doc_freq"]
+        index._reset()
+        index._idf = arrays["idf"]
+
+        return index
+
+    @staticmethod
+    def _tf_matrix(corpus: Iterable[List[str]], vocabulary: Dict[str, int]) -> sparse.csr_matrix:
+        """Documents x terms matrix of ``corpus``, adding new terms to ``vocabulary``."""
+        indptr, indices = [0], []
+
+        for tokens in corpus:
+            indices.extend(vocabulary.setdefault(token, len(vocabulary)) for token in tokens)
+            indptr.append(len(indices))
+
+        tf = sparse.csr_matrix((np.ones(len(indices)), np.asarray(indices, dtype=np.int64), indptr),
+                               shape=(len(indptr) - 1, len(vocabulary)))
+        # duplicate (document, term) entries are summed into term frequencies
+        tf.sum_duplicates()
+
+        return tf
+
+    @classmethod
+    def from_tokens(cls, corpus: Iterable[List[str]], **kwargs) -> "BM25Index":
+        """Build the index from tokenized documents; ``kwargs`` are ``k1``, ``b`` and ``epsilon``."""
+        vocabulary: Dict[str, int] = {}
+        tf = cls._tf_matrix(corpus, vocabulary)
+
+        return cls(vocabulary, tf.T.tocsr(), **kwargs)
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / self.corpus_size if self.corpus_size else 0.0
+
+    @property
+    def idf(self) -> np.ndarray:
+        if self._idf is None:
+            df = self.doc_freq
+            idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+            # terms left in no document are not part of the vocabulary of a rebuilt index
+            present = df > 0
+            if present.any():
+                idf[(idf < 0) & present] = self.epsilon * idf[present].mean()
+            self._idf = idf
+
+        return self._idf
+
+    def _vocabulary(self) -> Dict[str, int]:
+        if self.vocabulary is None:
+            self.vocabulary = dict(zip(self.sorted_terms.tolist(), self.sorted_term_ids.tolist()))
+
+        return self.vocabulary
+
+    def _weights(self) -> sparse.csr_matrix:
+        """Terms x documents matrix of per-occurrence BM25 weights, shaped like ``postings``."""
+        terms = np.repeat(np.arange(self.postings.shape[0]), np.diff(self.postings.indptr))
+
+        return sparse.csr_matrix((self._occurrence_weights(terms, self.postings.indices, self.postings.data),
+                                  self.postings.indices, self.postings.indptr), shape=self.postings.shape)
+
+    def _occurrence_weights(self, terms: np.ndarray, docs: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / (self.avgdl or 1.0))
+
+        return self.idf[terms] * tf * (self.k1 + 1) / (tf + norm)
+
+    def _modified(self):
+        """Drop what depends on the corpus statistics before they change."""
+        self._vocabulary()
+        self.weights = None
+        self._idf = None
+        if not self.doc_freq.flags.writeable:
+            self.doc_freq = self.doc_freq.copy()
+
+    def add(self, corpus: Iterable[List[str]]) -> np.ndarray:
+        """Add tokenized documents, in time proportional to their size.
+
+        Returns:
+            The numbers of the new documents, which follow the existing ones.
+        """
+        self._modified()
+        tf = self._tf_matrix(corpus, self.vocabulary)
+        first = len(self.doc_len)
+
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        self.doc_len = np.concatenate([self.doc_len, doc_len])
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(doc_len), dtype=bool)])
+        self.doc_freq = np.concatenate([self.doc_freq, np.zeros(len(self.vocabulary) - len(self.doc_freq),
+                                                                dtype=self.doc_freq.dtype)])
+        np.add.at(self.doc_freq, tf.indices, 1)
+
+        self.corpus_size += len(doc_len)
+        self.total_len += float(doc_len.sum())
+        self._segments.append((first, tf))
+
+        return np.arange(first, first + len(doc_len))
+
+    def _document_terms(self, doc: int) -> np.ndarray:
+        tf, row = self.tf, doc
+        for first, segment in self._segments:
+            if doc >= first:
+                tf, row = segment, doc - first
+
+        return tf.indices[tf.indptr[row]:tf.indptr[row + 1]]
+
+    def delete(self, docs: Iterable[int]):
+        """Remove documents by number, in time proportional to their size; numbers stay valid until ``compact``."""
+        self._modified()
+
+        for doc in docs:
+            if self.deleted[doc]:
+                continue
+            self.deleted[doc] = True
+            self.doc_freq[self._document_terms(doc)] -= 1
+            self.corpus_size -= 1
+            self.total_len -= float(self.doc_len[doc])
+
+    def compact(self) -> np.ndarray:
+        """Merge added documents into the main matrices and drop deleted ones, renumbering the documents.
+
+        Restores the precomputed weights, and is needed before ``save``.
+
+        Returns:
+            The former numbers of the remaining documents, in their new order.
+        """
+        live = np.flatnonzero(~self.deleted)
+        if self.weights is not None:
+            return live
+
+        terms = len(self.vocabulary)
+        tf = sparse.vstack([sparse.csr_matrix((m.data, m.indices, m.indptr), shape=(m.shape[0], terms))
+                            for m in [self.tf] + [segment for _, segment in self._segments]], format="csr")
+
+        self.__init__(self.vocabulary, tf[live].T.tocsr(), k1=self.k1, b=self.b, epsilon=self.epsilon)
+
+        return live
+
+    def _term_ids(self, tokens: List[str]) -> List[int]:
+        """Rows of the ``tokens`` in the vocabulary; unknown tokens are dropped."""
+        if self.vocabulary is not None:
+            return [self.vocabulary[token] for token in tokens if token in self.vocabulary]
+
+        if not tokens or not len(self.sorted_terms):
+            return []
+
+        tokens = np.asarray(tokens, dtype=str)
+        positions = np.minimum(np.searchsorted(self.sorted_terms, tokens), len(self.sorted_terms) - 1)
+        found = self.sorted_terms[positions] == tokens
+
+        return self.sorted_term_ids[positions[found]].tolist()
+
+    def _query_matrix(self, queries: List[List[str]]) -> sparse.csr_matrix:
+        """Queries x terms matrix of query term counts; terms outside the vocabulary score 0 and are dropped."""
+        indptr, indices = [0], []
+        for tokens in queries:
+            indices.extend(self._term_ids(tokens))
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix((np.ones(len(indices)), np.asarray(indices, dtype=np.int64), indptr),
+                                   shape=(len(queries), len(self.doc_freq)))
+        matrix.sum_duplicates()
+
+        return matrix
+
+    def _segment_scores(self, queries: sparse.csr_matrix, first: int, postings: sparse.csr_matrix) -> np.ndarray:
+        """Scores of the documents of ``postings``, weighting only the postings of the query terms."""
+        used = np.unique(queries.indices[queries.indices < postings.shape[0]])
+        rows = postings[used].tocoo()
+
+        return self._used_term_scores(queries, used, rows.row, rows.col, rows.data, first, postings.shape[1])
+
+    def _added_scores(self, queries: sparse.csr_matrix, first: int, tf: sparse.csr_matrix) -> np.ndarray:
+        """Scores of the documents of an added batch, from the query term columns of its ``tf``."""
+        used = np.unique(queries.indices[queries.indices < tf.shape[1]])
+        columns = tf[:, used].tocoo()
+
+        return self._used_term_scores(queries, used, columns.col, columns.row, columns.data, first, tf.shape[0])
+
+    def _used_term_scores(self, queries: sparse.csr_matrix, used: np.ndarray, rows: np.ndarray, docs: np.ndarray,
+                          tf: np.ndarray, first: int, n_docs: int) -> np.ndarray:
+        data = self._occurrence_weights(used[rows], docs + first, tf)
+        weights = sparse.csr_matrix((data, (rows, docs)), shape=(len(used), n_docs))
+
+        return (queries[:, used] @ weights).toarray()
+
+    def get_batch_scores(self, queries: List[List[str]]) -> np.ndarray:
+        """Queries x documents matrix of BM25 scores; deleted documents score ``-inf``."""
+        matrix = self._query_matrix(queries)
+        if self.weights is not None:
+            return (matrix @ self.weights).toarray()
+
+        scores = np.concatenate([self._segment_scores(matrix, 0, self.postings)]
+                                + [self._added_scores(matrix, first, tf) for first, tf in self._segments], axis=1)
+        scores[:, self.deleted] = -np.inf
+
+        return scores
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        return self.get_batch_scores([query])[0]
+
+    def top_k(self, queries: List[List[str]], k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Indices and scores of the ``k`` best documents per query, best first."""
+        return list(zip(*top_k_rows(self.get_batch_scores(queries), min(k, self.corpus_size))))
+
+
+def cached_index(texts: List[str], tokenize: Callable[[List[str]], List[List[str]]], tokenizer_name: str,
+                 **bm25_params: Any) -> BM25Index:
+    """Load the index saved for ``texts`` tokenized by ``tokenizer_name``, building and saving it first if needed.
+
+    Indexes live under ``.cache/week_1/bm25``, keyed by the corpus hash, the
+    tokenizer and ``bm25_params``, and are loaded memory-mapped.
+
+    Args:
+        texts: The corpus.
+        tokenize: Tokenizes the whole corpus, e.g. ``tokenization.tokenize_corpus``; only called on a miss.
+        tokenizer_name: Identifies ``tokenize`` in the key.
+        **bm25_params: ``k1``, ``b`` and ``epsilon``.
+    """
+    key = hashlib.sha1(json.dumps([INDEX_VERSION, TOKENIZATION_VERSION, tokenizer_name, corpus_hash(texts),
+                                   bm25_params], sort_keys=True).encode("utf-8")).hexdigest()
+    directory = os.path.join(get_cache_dir("bm25"), key)
+
+    if not os.path.isdir(directory):
+        BM25Index.from_tokens(tokenize(texts), **bm25_params).save(directory)
+
+    return BM25Index.load(directory)
+
+
+class SparseBM25Retriever(BaseRetriever):
+    """Drop-in replacement of ``BM25Retriever`` scored by ``BM25Index``.
+
+    Returns the same documents as ``BM25Retriever`` with the same ``bm25_params``
+    and ``preprocess_func``, and adds ``search_batch`` to answer many queries
+    with a single sparse product, and ``add_documents``/``delete`` to change
+    the corpus without rebuilding the index.
+    """
+
+    index: BM25Index
+    docs: List[Document]
+    k: int = 4
+    preprocess_func: Callable[[str], List[str]] = default_preprocessing_func
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # Document.id -> position in docs and in the index, built on the first delete
+    _positions: Optional[Dict[str, int]] = PrivateAttr(default=None)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], metadatas: Optional[Iterable[dict]] = None,
+                   ids: Optional[Iterable[str]] = None, bm25_params: Optional[Dict[str, Any]] = None,
+                   preprocess_func: Callable[[str], List[str]] = default_preprocessing_func,
+                   tokenized: Optional[List[List[str]]] = None, **kwargs: Any) -> "SparseBM25Retriever":
+        """Build the retriever from texts.
+
+        Args:
+            tokenized: The texts already run through ``preprocess_func``, e.g.
+                from ``tokenization.tokenize_corpus``; computed when omitted.
+        """
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [None] * len(texts)
+
+        if tokenized is None:
+            tokenized = [preprocess_func(text) for text in texts]
+
+        docs = [Document(page_content=text, metadata=metadata, id=id_)
+                for text, metadata, id_ in zip(texts, metadatas, ids)]
+
+        return cls(index=BM25Index.from_tokens(tokenized, **(bm25_params or {})), docs=docs,
+                   preprocess_func=preprocess_func, **kwargs)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document], **kwargs: Any) -> "SparseBM25Retriever":
+        documents = list(documents)
+
+        return cls.from_texts(texts=[d.page_content for d in documents], metadatas=[d.metadata for d in documents],
+                              ids=[d.id for d in documents], **kwargs)
+
+    @classmethod
+    def from_document_stream(cls, documents: Iterable[Document], chunk_size: int = 10_000,
+                             tokenize: Optional[Callable[[List[str]], List[List[str]]]] = None,
+                             bm25_params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> "SparseBM25Retriever":
+        """Build the retriever from a stream of documents, ``chunk_size`` at a time.
+
+        Texts are tokenized one chunk at a time, and each chunk's tokens are
+        dropped once its term counts are added to the index (see
+        ``BM25Index.add``); the index is compacted at the end. The documents
+        themselves are all kept, since the retriever returns them, as are the
+        term counts of every chunk until the final compaction.
+
+        Args:
+            documents: Any iterable, e.g. a generator over a file.
+            chunk_size: Documents tokenized and indexed together.
+            tokenize: Tokenizes a chunk of texts at once, e.g. ``tokenization.tokenize_batch``;
+                defaults to ``preprocess_func`` per text.
+        """
+        retriever = cls(index=BM25Index.from_tokens([], **(bm25_params or {})), docs=[], **kwargs)
+
+        documents = iter(documents)
+        while chunk := list(islice(documents, chunk_size)):
+            texts = [document.page_content for document in chunk]
+            retriever.add_documents(chunk, tokenize(texts) if tokenize else None)
+
+        retriever.compact()
+
+        return retriever
+
+    def add_documents(self, documents: Iterable[Document], tokenized: Optional[List[List[str]]] = None):
+        """Index more documents, e.g. another poem collection; ``tokenized`` as in ``from_texts``."""
+        documents = list(documents)
+        if tokenized is None:
+            tokenized = [self.preprocess_func(document.page_content) for document in documents]
+
+        positions = self.index.add(tokenized)
+        self.docs.extend(documents)
+
+        if self._positions is not None:
+            self._positions.update((document.id, int(position)) for document, position in zip(documents, positions)
+                                   if document.id is not None)
+
+    def delete(self, ids: Iterable[str]):
+        """Remove the documents with these ``Document.id`` values.
+
+        Raises:
+            KeyError: When an id matches no indexed document, e.g. documents
+                built without ids or already deleted; nothing is deleted then.
+        """
+        if self._positions is None:
+            self._positions = {document.id: i for i, document in enumerate(self.docs) if document.id is not None}
+
+        ids = list(dict.fromkeys(ids))
+        unknown = [id_ for id_ in ids if id_ not in self._positions]
+        if unknown:
+            raise KeyError(f"No indexed document has the id(s) {unknown[:5]}"
+                           + ("" if self._positions else "; the documents were indexed without Document.id"))
+
+        self.index.delete(self._positions.pop(id_) for id_ in ids)
+
+    def compact(self):
+        """Drop deleted documents for good and restore the index's precomputed weights, see ``BM25Index.compact``."""
+        live = self.index.compact()
+        self.docs = [self.docs[i] for i in live]
+        self._positions = None
+
+    def search_batch(self, queries: List[str], k: Optional[int] = None) -> List[List[Document]]:
+        """The ``k`` (default ``self.k``) most relevant documents of every query."""
+        top = self.index.top_k([self.preprocess_func(query) for query in queries], k or self.k)
+
+        return [[self.docs[i] for i in indices] for indices, _ in top]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search_batch([query])[0]
@@ -0,0 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, PrivateAttr, model_validator
+
+try:
+    import faiss
+except ImportError:  # the numpy search is used instead
+    faiss = None
+
+from tutorial.week_1.bm25 import SparseBM25Retriever, top_k_rows
+
+# Rank offset of reciprocal rank fusion, as in EnsembleRetriever
+RRF_C = 60
+
+
+class DenseIndex:
+    """Cosine similarity search over document embeddings, with faiss when it is installed.
+
+    Args:
+        vectors: Documents x dimensions embeddings.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = self._normalize(vectors)
+
+        self._faiss = None
+        if faiss is not None and len(self.vectors):
+            self._faiss = faiss.IndexFlatIP(self.vectors.shape[1])
+            self._faiss.add(self.vectors)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def top_k(self, queries, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and cosine similarities of the ``k`` nearest documents of every query vector, nearest first."""
+        queries = self._normalize(queries)
+        k = min(k, len(self))
+
+        if self._faiss is not None and k > 0:
+            scores, indices = self._faiss.search(queries, k)
+            return indices.astype(np.int64), scores
+
+        return top_k_rows(queries @ self.vectors.T, k)
+
+
+class DenseRetriever(BaseRetriever):
+    """Embedding retriever over a ``DenseIndex``, like a FAISS vector store retriever."""
+
+    embeddings: Embeddings
+    index: DenseIndex
+    docs: List[Document]
+    k: int = 4
+    # queries of a batch embedded at the same time
+    max_concurrency: int = 8
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @classmethod
+    def from_documents(cls, documents: Sequence[Document], embeddings: Embeddings,
+                       **kwargs: Any) -> "DenseRetriever":
+        documents = list(documents)
+        vectors = embeddings.embed_documents([document.page_content for document in documents])
+
+        return cls(embeddings=embeddings, index=DenseIndex(np.reshape(vectors, (len(documents), -1))),
+                   docs=documents, **kwargs)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed ``queries`` with ``embed_query``, several at once on ``max_concurrency`` threads.
+
+        ``embed_documents`` is not used even for a batch: models with separate
+        query and document encoders (or prefixes) would embed them differently.
+        """
+        if len(queries) == 1:
+            return np.asarray([self.embeddings.embed_query(queries[0])])
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(queries))) as executor:
+            return np.asarray(list(executor.map(self.embeddings.embed_query, queries)))
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        indices, _ = self.index.top_k(self.embed_queries([query]), self.k)
+
+        return [self.docs[i] for i in indices[0]]
+
+
+def fuse(rankings: Sequence[Tuple[np.ndarray, np.ndarray]], weights: Sequence[float], k: int,
+         method: Literal["rrf", "score"] = "rrf", c: int = RRF_C) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Fuse per-query rankings of several retrievers into the ``k`` best documents per query.
+
+    With ``"rrf"`` a document gets ``weight / (c + rank)`` from every ranking
+    it appears in, as in ``EnsembleRetriever``; with ``"score"`` it gets its
+    score min-max normalized within the query's ranking, times the weight.
+    All queries are fused at once with array operations.
+
+    Args:
+        rankings: Per retriever, queries x candidates arrays of document indices
+            and scores, best first.
+        weights: Per retriever.
+        k: Documents kept per query.
+        method: ``"rrf"`` (reciprocal rank) or ``"score"`` (normalized score).
+        c: Rank offset of ``"rrf"``.
+
+    Returns:
+        Per query, the fused document indices and scores, best first.
+    """
+    queries = len(rankings[0][0])
+    docs = max((int(indices.max()) + 1 for indices, _ in rankings if indices.size), default=1)
+
+    keys, values = [], []
+    for (indices, scores), weight in zip(rankings, weights):
+        if method == "rrf":
+            contribution = np.broadcast_to(weight / (c + 1 + np.arange(indices.shape[1])), indices.shape)
+        else:
+            scores = np.asarray(scores, dtype=np.float64)
+            low = scores.min(axis=1, keepdims=True, initial=np.inf)
+            span = scores.max(axis=1, keepdims=True, initial=-np.inf) - low
+            contribution = weight * np.divide(scores - low, span, out=np.ones_like(scores), where=span > 0)
+
+        # one key per (query, document) pair, so contributions add up per pair
+        keys.append((np.arange(queries)[:, None] * docs + indices).ravel())
+        values.append(contribution.ravel())
+
+    pairs, first, inverse = np.unique(np.concatenate(keys), return_index=True, return_inverse=True)
+    fused = np.bincount(inverse, weights=np.concatenate(values))
+    query, doc = np.divmod(pairs, docs)
+
+    # ties keep the order documents first appear in, rankings in turn, as EnsembleRetriever does
+    order = np.lexsort((first, -fused, query))
+    query, doc, fused = query[order], doc[order], fused[order]
+    starts = np.searchsorted(query, np.arange(queries))
+    ends = np.minimum(np.searchsorted(query, np.arange(queries), side="right"), starts + k)
+
+    return [(doc[start:end], fused[start:end]) for start, end in zip(starts, ends)]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 and embedding retrieval over the same documents, run concurrently and fused.
+
+    Unlike ``EnsembleRetriever``, which calls its retrievers one after the
+    other and fuses their documents in Python, the BM25 leg runs on a thread
+    while the queries are embedded, and both rankings are fused as arrays of
+    document positions (see ``fuse``). ``search_batch`` answers many queries
+    with one BM25 product while their embeddings are computed concurrently.
+
+    Args:
+        sparse: BM25 leg.
+        dense: Embedding leg, over the same documents in the same order.
+        k: Documents returned per query.
+        fetch_k: Candidates taken from each leg before fusion.
+        fusion: ``"rrf"`` (reciprocal rank) or ``"score"`` (normalized score).
+        weights: Weights of the sparse and dense legs.
+    """
+
+    sparse: SparseBM25Retriever
+    dense: DenseRetriever
+    k: int = 4
+    fetch_k: int = 20
+    fusion: Literal["rrf", "score"] = "rrf"
+    weights: Tuple[float, float] = (0.5, 0.5)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    _executor: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="hybrid-sparse"))
+
+    @model_validator(mode="after")
+    def _check_alignment(self) -> "HybridRetriever":
+        if len(self.sparse.docs) != len(self.dense.docs):
+            raise ValueError(f"The sparse leg has {len(self.sparse.docs)} documents and the dense leg "
+                             f"{len(self.dense.docs)}; both must index the same documents in the same order")
+
+        return self
+
+    @classmethod
+    def from_sparse(cls, sparse: SparseBM25Retriever, embeddings: Embeddings, **kwargs: Any) -> "HybridRetriever":
+        """Add an embedding leg over the documents of ``sparse``."""
+        return cls(sparse=sparse, dense=DenseRetriever.from_documents(sparse.docs, embeddings), **kwargs)
+
+    def _sparse_leg(self, queries: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        top = self.sparse.index.top_k([self.sparse.preprocess_func(query) for query in queries], self.fetch_k)
+
+        return np.stack([indices for indices, _ in top]), np.stack([scores for _, scores in top])
+
+    def search_batch(self, queries: List[str], k: Optional[int] = None) -> List[List[Document]]:
+        """The ``k`` (default ``self.k``) best fused documents of every query."""
+        if not queries:
+            return []
+
+        sparse = self._executor.submit(self._sparse_leg, queries)
+        dense = self.dense.index.top_k(self.dense.embed_queries(queries), self.fetch_k)
+
+        fused = fuse([sparse.result(), dense], self.weights, k or self.k, method=self.fusion)
+
+        return [[self.sparse.docs[i] for i in indices] for indices, _ in fused]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search_batch([query])[0]
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+from src.path.path_definition import get_project_dir
+
+# Special tokens dropped from the output
+SPECIAL_TOKENS = frozenset({"<s>", "</s>", "[PAD]", "[UNK]"})
+# Bump when the cleaning rules change so stale cached corpora are ignored
+TOKENIZATION_VERSION = 1
+
+# Keep only Chinese/English/number words
+_WORD = re.compile(r'[\w一-龥]+')
+
+
+@lru_cache(maxsize=None)
+def clean_token(token: str) -> Optional[str]:
+    """Strip the BPE word marker from ``token``, or ``None`` when it is not a word.
+
+    A vocabulary has a bounded number of tokens, so each one is only checked once.
+    """
+    if token in SPECIAL_TOKENS:
+        return None
+
+    token = token.replace("▁", "")
+
+    return token if _WORD.match(token) else None
+
+
+def _tokens(tokenizer, encoded, i: int) -> List[str]:
+    if tokenizer.is_fast:
+        return encoded.tokens(i)
+
+    return tokenizer.convert_ids_to_tokens(encoded["input_ids"][i])
+
+
+def tokenize_batch(tokenizer, texts: List[str], batch_size: int = 512) -> List[List[str]]:
+    """Tokenize ``texts`` into lists of words, ``batch_size`` texts per tokenizer call.
+
+    Fast tokenizers encode a batch in parallel in Rust and return the token
+    strings directly, without a round trip through the ids.
+    """
+    tokenized = []
+
+    for start in range(0, len(texts), batch_size):
+        encoded = tokenizer(texts[start:start + batch_size], add_special_tokens=False)
+        for i in range(len(encoded["input_ids"])):
+            cleaned = map(clean_token, _tokens(tokenizer, encoded, i))
+            tokenized.append([token for token in cleaned if token is not None])
+
+    return tokenized
+
+
+def corpus_hash(texts: Iterable[str]) -> str:
+    """Hash of the corpus content, in order."""
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def get_cache_dir(name: str) -> str:
+    """Return (and create) a cache sub-directory under ``<project>/.cache/week_1``."""
+    directory = os.path.join(get_project_dir(), ".cache", "week_1", name)
+    os.makedirs(directory, exist_ok=True)
+
+    return directory
+
+
+def tokenize_corpus(tokenizer, texts: List[str], cache: bool = True) -> List[List[str]]:
+    """``tokenize_batch`` over the whole corpus, persisted between runs.
+
+    The result is cached on disk by the tokenizer name and the corpus hash, so
+    restarting the app only re-tokenizes when the corpus or the tokenizer changes.
+    """
+    if not cache:
+        return tokenize_batch(tokenizer, texts)
+
+    key = hashlib.sha1(json.dumps([TOKENIZATION_VERSION, tokenizer.name_or_path, corpus_hash(texts)])
+                       .encode("utf-8")).hexdigest()
+    path = os.path.join(get_cache_dir("tokenized"), f"{key}.json")
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    tokenized = tokenize_batch(tokenizer, texts)
+
+    # write-then-rename so concurrent readers never see a partial file
+    fd, tmp = tempfile.mkstemp(prefix=f"{key}.", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(tokenized, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    return tokenized